@@ -0,0 +1,59 @@
+# Paket açma süresi ölçümü: çok sayıda küçük dosya içeren bir .pkg.tar.zst üretilir ve
+# sıralı (threads=1) açma ile paralel açma karşılaştırılır.
+#
+#   python benchmarks/extract.py [--files N] [--size BYTES] [--runs N] [--threads N]
+import argparse
+import io
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+import archcraftpkg  # noqa: E402
+
+def build_package(workdir, count, size):
+    tar_path = Path(workdir) / "bench-1.0-1-x86_64.pkg.tar"
+    payload = os.urandom(size)
+    with tarfile.open(tar_path, "w") as tar:
+        for i in range(count):
+            info = tarfile.TarInfo(f"bench/usr/share/bench/d{i % 64}/f{i}")
+            info.size = size
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(payload))
+    subprocess.run(["zstd", "-q", "-f", "--rm", str(tar_path)], check=True)
+    return tar_path.name + ".zst"
+
+def time_extract(pkg, threads, runs):
+    samples = []
+    for _ in range(runs):
+        shutil.rmtree(archcraftpkg.CACHE_DIR / "bench", ignore_errors=True)
+        started = time.perf_counter()
+        files, _ = archcraftpkg.extract(pkg, threads=threads)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples, len(files)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=archcraftpkg.EXTRACT_THREADS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        archcraftpkg.CACHE_DIR = Path(workdir)
+        pkg = build_package(workdir, args.files, args.size)
+
+        for label, threads in (("sequential", 1), (f"parallel ({args.threads})", args.threads)):
+            samples, members = time_extract(pkg, threads, args.runs)
+            median = statistics.median(samples)
+            print(f"{label:<24} {median:8.1f} ms (min {min(samples):.1f}, max {max(samples):.1f}, {members} members)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# apkg açılış süresi ölçümü: --help, --version ve önbellekteki yerel indeksle search.
+#
+#   python benchmarks/startup.py [--runs N] [--max-ms MS]
+#
+# --max-ms verilirse medyanı bu süreyi aşan komut olduğunda çıkış kodu 1 olur.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+APKG = Path(__file__).resolve().parent.parent / "src" / "archcraftpkg.py"
+
+COMMANDS = {
+    "--help": ["--help"],
+    "--version": ["--version"],
+    "search (cached index)": ["search", "python-"],
+}
+
+def write_search_index(home, count=20000):
+    cache_dir = Path(home) / ".cache" / "archcraft-pkg"
+    cache_dir.mkdir(parents=True)
+    names = sorted(f"{prefix}-pkg{i}" for i in range(count // 4) for prefix in ("python", "lib", "font", "icon"))
+    with open(cache_dir / "search.idx", "w", encoding="utf-8") as f:
+        f.write("apkg-search-index 1\n")
+        for name in names:
+            f.write(f"{name}\tcore/STABLE\n")
+
+def time_command(args, env, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, str(APKG), *args], env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        write_search_index(home)
+        env = dict(os.environ, HOME=home)
+
+        # Yorumlayıcının kendi açılış süresi, karşılaştırma için
+        baseline = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, "-c", "pass"], check=True)
+            baseline.append((time.perf_counter() - started) * 1000)
+        print(f"{'python -c pass':<24} {statistics.median(baseline):8.1f} ms")
+
+        slow = []
+        for label, command in COMMANDS.items():
+            samples = time_command(command, env, args.runs)
+            median = statistics.median(samples)
+            print(f"{label:<24} {median:8.1f} ms (min {min(samples):.1f}, max {max(samples):.1f})")
+            if args.max_ms is not None and median > args.max_ms:
+                slow.append(label)
+
+    if slow:
+        print(f"[ERR] Over {args.max_ms} ms: {', '.join(slow)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
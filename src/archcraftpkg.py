@@ -1,22 +1,26 @@
 import subprocess
-import tempfile
 import os
-import urllib.request
 import sys
-import tarfile
 import glob
 import shutil
 import platform
 import json
 import re
+import time
+import hashlib
+import bisect
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
+# Ağ, arşiv ve veritabanı modülleri (urllib, http.client, tarfile, sqlite3, ...) yalnızca
+# onları kullanan fonksiyonların içinde import edilir; --help ve --version hızlı açılır.
+
 RED = "\033[31m"
 BOLD = "\033[1m"
 RESET = "\033[0m"
 
 CACHE_DIR = Path.home() / ".cache" / "archcraft-pkg"
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 VERSION = "1.0"
 AUTHOR = "Zaman Huseynli"
@@ -27,7 +31,68 @@ homedir = "/tmp/tmp_qe1irc7"
 KEYRING_PATH = "/etc/archcraft/keyring"
 MIRRORLIST = "/etc/archcraft/mirrorpkglist"
 PKG_DB = Path("/var/lib/apkg/installed")
-os.makedirs(PKG_DB, exist_ok=True)
+# Paket meta verisi ve dosya -> sahip indeksi; eski PKG_DB dizini ilk açılışta buraya taşınır
+PKG_DB_FILE = PKG_DB.parent / "packages.db"
+SNAPSHOT_FORMAT = 2
+
+# --parallel-mirrors ile aynı anda yoklanan mirror sayısı ve mirror başına zaman aşımı (sn)
+MIRROR_FANOUT = 4
+MIRROR_TIMEOUT = 10
+
+# Mirror index önbelleği: --index-ttl ile süre (sn), --offline ile ağa hiç çıkmadan eski kopya kullanılır
+INDEX_CACHE_DIR = CACHE_DIR / "index"
+INDEX_TTL = 3600
+INDEX_OFFLINE = False
+# Aynı URL'nin index'i aynı anda tek iş parçacığı tarafından çekilir, diğerleri yazılan kopyayı okur
+index_locks = {}
+index_locks_lock = threading.Lock()
+# apkg sync ile oluşturulan, tüm repo/release'leri birleştiren yerel arama indeksi
+SEARCH_INDEX = CACHE_DIR / "search.idx"
+SEARCH_INDEX_MAGIC = "apkg-search-index 1"
+
+# Paket açılırken dosyaları yazan iş parçacığı sayısı (1 = tarfile ile sıralı açma) ve
+# iş parçacıklarına devredilen en büyük dosya; daha büyükleri okuyucu doğrudan yazar
+EXTRACT_THREADS = min(8, os.cpu_count() or 1)
+EXTRACT_SMALL_FILE = 1024 * 1024
+
+# Doğrulanmış paketler hash ile adreslenen bu dizinde tutulur; kurulu paketler hariç
+# en uzun süredir kullanılmayanlar PKG_CACHE_BUDGET (bayt) aşılınca silinir
+PKG_CACHE_DIR = CACHE_DIR / "pkgs"
+PKG_CACHE_BUDGET = 2 * 1024 ** 3
+PKG_CACHE_BYPASS = False
+
+# İmza, paket indirilirken gpg'ye akıtılarak doğrulanır (ikinci bir tam okuma gerekmez)
+STREAM_VERIFY = True
+pkg_cache_lock = threading.Lock()
+
+# Tüm mirror trafiği tek HTTP istemcisinden geçer: host başına kalıcı bağlantı havuzu,
+# ortak zaman aşımı ve artan beklemeli yeniden deneme
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) archcraft-pkg/1.0"
+HTTP_TIMEOUT = 30
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+HTTP_POOL_SIZE = 4
+HTTP_MAX_REDIRECTS = 5
+http_pool = {}
+http_pool_lock = threading.Lock()
+
+# İndirmeler bu boyutta parçalar halinde .part dosyasına yazılır
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Çoklu kurulumda her aşamada aynı anda işlenebilecek paket sayısı
+DOWNLOAD_WORKERS = 4
+VERIFY_WORKERS = 2
+EXTRACT_WORKERS = 2
+
+# Gerçek indirmelerden toplanan mirror istatistikleri; yeni ölçümün ağırlığı MIRROR_STATS_ALPHA,
+# eski ölçümler her kayıtta bu oranda söner
+MIRROR_STATS = PKG_DB.parent / "mirrorstats.json"
+MIRROR_STATS_ALPHA = 0.3
+# Bu boyutun altındaki transferler hız ölçümüne katılmaz (gecikme baskın olur)
+MIRROR_STATS_MIN_BYTES = 64 * 1024
+# Yeni ölçüm gelmeyen mirror'ların hata cezası bu süre (sn) başına yarıya iner
+MIRROR_STATS_HALF_LIFE = 24 * 3600
+mirror_stats_lock = threading.Lock()
 
 def get_arch():
     arch = platform.machine().lower()
@@ -53,9 +118,9 @@ def ntp_sync():
             continue
     print("⚠ Warning: NTP synchronization failed or no supported tool found.")
 
-def read_mirrors(target_repo=None, release_type=None, query_string=None):
+def iter_mirrorlist():
+    # MIRRORLIST içindeki her sunucu için (repo, release, url) üretir
     arch = get_arch()
-    mirrors = []
     current_repo = None
     current_release = None
 
@@ -73,61 +138,500 @@ def read_mirrors(target_repo=None, release_type=None, query_string=None):
             elif line.startswith("#repopkgreleasedate="):
                 current_release = line.split("=", 1)[1].strip().upper()
             elif line.startswith("SERVER="):
-                if (not target_repo or current_repo == target_repo) and \
-                   (not release_type or current_release == release_type):
-                    url = line.split("=", 1)[1].replace("$arch", arch).rstrip("/")
-                    if query_string:
-                        if "?" in url:
-                            url += "&" + query_string
-                        else:
-                            url += "?" + query_string
-                    mirrors.append(url)
-    return mirrors
+                url = line.split("=", 1)[1].replace("$arch", arch).rstrip("/")
+                yield current_repo, current_release, url
+
+def mirror_origin(mirror):
+    # Mirror URL'sinin MIRRORLIST'te bağlı olduğu (repo, release)
+    for repo, release, url in iter_mirrorlist():
+        # read_mirrors query_string'i URL'ye eklemiş olabilir
+        if mirror == url or mirror.startswith((url + "?", url + "&")):
+            return repo, release
+    return None, None
+
+def read_mirrors(target_repo=None, release_type=None, query_string=None):
+    mirrors = []
+    for current_repo, current_release, url in iter_mirrorlist():
+        if (not target_repo or current_repo == target_repo) and \
+           (not release_type or current_release == release_type):
+            if query_string:
+                if "?" in url:
+                    url += "&" + query_string
+                else:
+                    url += "?" + query_string
+            mirrors.append(url)
+    return rank_mirrors(mirrors)
+
+def load_mirror_stats():
+    try:
+        with open(MIRROR_STATS, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def record_mirror_stat(mirror, ok, latency=None, throughput=None):
+    key = mirror.split("?", 1)[0]
+    sample = {"latency": latency, "throughput": throughput, "failure": 0.0 if ok else 1.0}
+    with mirror_stats_lock:
+        stats = load_mirror_stats()
+        entry = stats.setdefault(key, {"latency": None, "throughput": None, "failure": None, "samples": 0})
+        for field, value in sample.items():
+            if value is None:
+                continue
+            if entry[field] is None:
+                entry[field] = value
+            else:
+                entry[field] = (1 - MIRROR_STATS_ALPHA) * entry[field] + MIRROR_STATS_ALPHA * value
+        entry["samples"] += 1
+        entry["updated"] = time.time()
+        try:
+            os.makedirs(MIRROR_STATS.parent, exist_ok=True)
+            tmp_path = MIRROR_STATS.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(stats, f, indent=2)
+            os.replace(tmp_path, MIRROR_STATS)
+        except OSError as e:
+            print(f"⚠ Failed to save mirror statistics: {e}")
+
+def mirror_score(entry):
+    # Düşük skor daha iyi: 1 MiB'lık bir indirmenin tahmini süresi, hata oranıyla cezalandırılır.
+    # Hiç ölçülmemiş mirror'lar bir kez denensin diye öne alınır, eski hatalar zamanla unutulur.
+    if not entry:
+        return 0.0
+    latency = entry.get("latency")
+    if latency is None:
+        latency = MIRROR_TIMEOUT
+    throughput = entry.get("throughput")
+    transfer = (1024 * 1024) / throughput if throughput else 0.0
+    failure = entry.get("failure") or 0.0
+    age = time.time() - entry.get("updated", time.time())
+    failure *= 0.5 ** (max(0.0, age) / MIRROR_STATS_HALF_LIFE)
+    return (latency + transfer) * (1 + 10 * failure)
+
+def rank_mirrors(mirrors):
+    stats = load_mirror_stats()
+    return sorted(mirrors, key=lambda m: mirror_score(stats.get(m.split("?", 1)[0])))
+
+
+def http_connection(scheme, host, port, timeout):
+    import http.client
+    import urllib.parse
+    import urllib.request
+
+    key = (scheme, host, port)
+    with http_pool_lock:
+        idle = http_pool.get(key)
+        conn = idle.pop() if idle else None
+    if conn is not None:
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    proxy = urllib.request.getproxies().get(scheme)
+    if proxy and not urllib.request.proxy_bypass(host):
+        proxy_url = urllib.parse.urlsplit(proxy)
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(proxy_url.hostname, proxy_url.port or 80, timeout=timeout)
+            conn.set_tunnel(host, port)
+        else:
+            conn = http.client.HTTPConnection(proxy_url.hostname, proxy_url.port or 80, timeout=timeout)
+            conn.via_proxy = True
+    elif scheme == "https":
+        conn = http.client.HTTPSConnection(host, port, timeout=timeout)
+    else:
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    return conn, False
+
+def http_release(scheme, host, port, conn):
+    with http_pool_lock:
+        idle = http_pool.setdefault((scheme, host, port), [])
+        if len(idle) < HTTP_POOL_SIZE:
+            idle.append(conn)
+            return
+    conn.close()
+
+@contextmanager
+def http_open(url, headers=None, timeout=None, method="GET", compressed=False):
+    # Havuzdan bir bağlantıyla istek yapar ve http.client yanıtını verir. Yanıt gövdesi
+    # tamamen okunursa bağlantı havuza geri döner. 304 ve >= 400 durumları
+    # urllib.error.HTTPError olarak yükseltilir, yönlendirmeler izlenir.
+    import http.client
+    import urllib.error
+    import urllib.parse
+
+    timeout = timeout or HTTP_TIMEOUT
+    request_headers = {"User-Agent": USER_AGENT}
+    if compressed:
+        request_headers["Accept-Encoding"] = "gzip"
+    request_headers.update(headers or {})
+
+    for _ in range(HTTP_MAX_REDIRECTS + 1):
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme
+        port = parts.port or (443 if scheme == "https" else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        attempt = 0
+        while True:
+            conn, reused = http_connection(scheme, parts.hostname, port, timeout)
+            target = url if getattr(conn, "via_proxy", False) else path
+            try:
+                conn.request(method, target, headers=request_headers)
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                # Havuzdaki bağlantıyı sunucu kapatmış olabilir; bu bir deneme sayılmaz
+                if reused:
+                    continue
+                attempt += 1
+                if attempt >= HTTP_RETRIES:
+                    raise urllib.error.URLError(e)
+                time.sleep(HTTP_BACKOFF * 2 ** (attempt - 1))
+                continue
+            if response.status >= 500 and attempt + 1 < HTTP_RETRIES:
+                response.read()
+                conn.close()
+                attempt += 1
+                time.sleep(HTTP_BACKOFF * 2 ** (attempt - 1))
+                continue
+            break
 
+        if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+            response.read()
+            http_release(scheme, parts.hostname, port, conn)
+            url = urllib.parse.urljoin(url, response.getheader("Location"))
+            continue
+        if response.status == 304 or response.status >= 400:
+            response.read()
+            http_release(scheme, parts.hostname, port, conn)
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
 
-def get_files_json(mirror_url):
+        try:
+            yield response
+            if method == "HEAD":
+                response.read()
+        except BaseException:
+            conn.close()
+            raise
+        if response.isclosed() and not response.will_close:
+            http_release(scheme, parts.hostname, port, conn)
+        else:
+            conn.close()
+        return
+    raise urllib.error.URLError(f"too many redirects: {url}")
+
+def http_read(response):
+    import gzip
+
+    data = response.read()
+    if response.getheader("Content-Encoding") == "gzip":
+        data = gzip.decompress(data)
+    return data
+
+def fetch_index(url, parse, timeout=None, revalidate=False):
+    # Mirror index'ini CACHE_DIR/index altında URL anahtarıyla saklar.
+    # TTL içindeyse ağa çıkmaz, süresi dolmuşsa ya da revalidate istenmişse
+    # ETag/Last-Modified ile yeniden doğrular.
+    import urllib.error
+
+    with index_locks_lock:
+        lock = index_locks.setdefault(url, threading.Lock())
+    with lock:
+        INDEX_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        cache_file = INDEX_CACHE_DIR / (hashlib.sha256(url.encode()).hexdigest() + ".json")
+        cached = None
+        if cache_file.exists():
+            try:
+                with open(cache_file, "r") as f:
+                    cached = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                cached = None
+
+        if cached is not None:
+            if INDEX_OFFLINE or (not revalidate and time.time() - cached["fetched"] < INDEX_TTL):
+                return cached["entries"]
+        elif INDEX_OFFLINE:
+            print(f"⚠ No cached index for {url} (offline mode)")
+            return None
+
+        headers = {}
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            with http_open(url, headers, timeout, compressed=True) as resp:
+                body = http_read(resp).decode("utf-8")
+                etag = resp.headers.get("ETag")
+                last_modified = resp.headers.get("Last-Modified")
+            entries = parse(body)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached is not None:
+                entries, etag, last_modified = cached["entries"], cached.get("etag"), cached.get("last_modified")
+            else:
+                raise
+        except Exception as e:
+            if cached is None:
+                raise
+            print(f"⚠ Index refresh failed, using stale copy: {url} ({e})")
+            return cached["entries"]
+
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump({
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched": time.time(),
+                "entries": entries,
+            }, f)
+        os.replace(tmp_file, cache_file)
+        return entries
+
+def parse_autoindex(html):
+    files = re.findall(r'<a href="([^"/][^"]*)">', html)
+    return [{"name": f, "type": "file"} for f in files]
+
+def get_files_json(mirror_url, timeout=None, revalidate=False):
     url = mirror_url.rstrip('/') + "/files.json"
     try:
-        output = subprocess.check_output([
-            "curl", "-sL",
-            "-A", "Mozilla/5.0 (X11; Linux x86_64) archcraft-pkg/1.0",
-            url
-        ])
-        return json.loads(output.decode("utf-8"))
-    except subprocess.CalledProcessError as e:
-        print(f"⚠ files.json read failed via curl: {url} (exit code: {e.returncode})")
-        return None
+        return fetch_index(url, json.loads, timeout, revalidate)
     except json.JSONDecodeError as je:
         print(f"⚠ JSON parse error: {url} ({je})")
         return None
+    except Exception as e:
+        print(f"⚠ files.json read failed: {url} ({e})")
+        return None
 
-def get_autoindex_file_list(mirror_url):
+def get_autoindex_file_list(mirror_url, timeout=None, revalidate=False):
     try:
-        with urllib.request.urlopen(mirror_url) as resp:
-            html = resp.read().decode("utf-8")
-        files = re.findall(r'<a href="([^"/][^"]*)">', html)
-        return [{"name": f, "type": "file"} for f in files]
+        return fetch_index(mirror_url, parse_autoindex, timeout, revalidate)
     except Exception as e:
         print(f"⚠ Autoindex directory listing failed: {mirror_url} ({e})")
         return None
 
-def download_file(url, filename):
+def feed_file(path, sink):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            sink(chunk)
+
+def response_validator(response):
+    # If-Range ve önbellek doğrulaması için güçlü ETag, yoksa Last-Modified
+    etag = response.getheader("ETag", "")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.getheader("Last-Modified", "")
+
+def download_file(url, filename, timeout=None, mirror=None, sink=None):
+    # sink verilirse paketin tüm baytları (devam edilen kısım dahil) sırayla ona da aktarılır
+    import urllib.error
+
     output_path = CACHE_DIR / filename
+    part_path = CACHE_DIR / (filename + ".part")
+    # .part'ın geldiği sürümün ETag/Last-Modified değeri; devam isteği If-Range ile gönderilir ki
+    # başka bir mirror'dan ya da eski bir sürümden kalan baytlar yeni dosyaya eklenmesin.
+    # İndirme bitince <dosya>.validator olarak kalır, paket önbelleği tazelik kontrolünde kullanır.
+    validator_path = CACHE_DIR / (filename + ".part.validator")
+    done_validator_path = CACHE_DIR / (filename + ".validator")
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) archcraft-pkg/1.0"
-        }
-        req = urllib.request.Request(url, headers=headers)
-        with urllib.request.urlopen(req) as response, open(output_path, 'wb') as out_file:
-            out_file.write(response.read())
+        headers = {}
+        # Yarım kalmış indirme varsa kaldığı yerden devam et
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        validator = validator_path.read_text().strip() if offset and validator_path.exists() else ""
+        if offset and validator:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+        else:
+            offset = 0
+        started = time.monotonic()
+        try:
+            with http_open(url, headers, timeout) as response:
+                latency = time.monotonic() - started
+                mode = "wb"
+                if offset and response.status == 206:
+                    # Content-Range: bytes <başlangıç>-<son>/<toplam>
+                    content_range = response.getheader("Content-Range", "")
+                    if content_range.partition(" ")[2].partition("-")[0] == str(offset):
+                        print(f"↻ Resuming {filename} from byte {offset}")
+                        mode = "ab"
+                    else:
+                        mode = None
+                if sink and mode == "ab":
+                    feed_file(part_path, sink)
+                if mode:
+                    with open(part_path, mode) as out_file:
+                        if mode == "wb":
+                            validator = response_validator(response)
+                            if validator:
+                                validator_path.write_text(validator)
+                            else:
+                                validator_path.unlink(missing_ok=True)
+                        start_size = out_file.tell()
+                        if sink is None:
+                            shutil.copyfileobj(response, out_file, DOWNLOAD_CHUNK_SIZE)
+                        else:
+                            for chunk in iter(lambda: response.read(DOWNLOAD_CHUNK_SIZE), b""):
+                                out_file.write(chunk)
+                                sink(chunk)
+                        received = out_file.tell() - start_size
+        except urllib.error.HTTPError as e:
+            if e.code != 416:
+                raise
+            # .part dosyası zaten tam ya da sunucudakiyle uyuşmuyor
+            total = e.headers.get("Content-Range", "").rpartition("/")[2]
+            if total.isdigit() and int(total) == offset:
+                if sink:
+                    feed_file(part_path, sink)
+                os.replace(part_path, output_path)
+                os.replace(validator_path, done_validator_path)
+                print(f"✔ Downloaded {filename} to {output_path}")
+                return True
+            os.remove(part_path)
+            validator_path.unlink(missing_ok=True)
+            return download_file(url, filename, timeout, mirror, sink)
+        if mode is None:
+            # Sunucu istenen konumdan başlamadı; baytlar .part'a eklenemez, baştan indir
+            print(f"⚠ Unexpected Content-Range for {filename}, restarting download")
+            part_path.unlink(missing_ok=True)
+            validator_path.unlink(missing_ok=True)
+            return download_file(url, filename, timeout, mirror, sink)
+        elapsed = time.monotonic() - started - latency
+        os.replace(part_path, output_path)
+        if validator_path.exists():
+            os.replace(validator_path, done_validator_path)
+        else:
+            done_validator_path.unlink(missing_ok=True)
         print(f"✔ Downloaded {filename} to {output_path}")
+        if mirror:
+            throughput = None
+            if received >= MIRROR_STATS_MIN_BYTES and elapsed > 0:
+                throughput = received / elapsed
+            record_mirror_stat(mirror, True, latency, throughput)
         return True
     except Exception as e:
         print(f"❌ Failed to download {url}: {e}")
+        if mirror:
+            record_mirror_stat(mirror, False)
         return False
 
-def download_from_mirrors(pkg, sig, target_repo=None, release_type=None, query_string=None, use_autoindex=False):
+def probe_mirror(mirror, pkg, use_autoindex=False, timeout=None):
+    if use_autoindex:
+        file_list = get_autoindex_file_list(mirror, timeout)
+    else:
+        file_list = get_files_json(mirror, timeout)
+    if file_list:
+        return any(entry.get("name") == pkg for entry in file_list)
+
+    # Paket listesi yoksa doğrudan HEAD isteği ile kontrol et
+    try:
+        with http_open(f"{mirror.rstrip('/')}/{pkg}", timeout=timeout, method="HEAD") as response:
+            return response.status == 200
+    except Exception:
+        return False
+
+def race_mirrors(mirrors, pkg, use_autoindex=False, fanout=MIRROR_FANOUT, timeout=MIRROR_TIMEOUT):
+    # Mirror'ları aynı anda yoklar, paketi bulunduranları cevap verme sırasıyla döndürür.
+    # Yoklamalar daemon iş parçacıklarında çalışır: çağıran taraf yeterli mirror bulduğunda
+    # yeni yoklama başlamaz, yanıt vermeyen mirror'lardaki yoklamalar da çıkışta beklenmez.
+    import queue
+
+    pending = queue.Queue()
+    for mirror in mirrors:
+        pending.put(mirror)
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def worker():
+        while not stop.is_set():
+            try:
+                mirror = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results.put((mirror, probe_mirror(mirror, pkg, use_autoindex, timeout), None))
+            except Exception as e:
+                results.put((mirror, False, e))
+
+    for _ in range(min(max(1, fanout), len(mirrors))):
+        threading.Thread(target=worker, daemon=True).start()
+    try:
+        for _ in mirrors:
+            mirror, found, error = results.get()
+            if error is not None:
+                print(f"❌ Mirror probe failed: {mirror} ({error})")
+            elif found:
+                yield mirror
+            else:
+                print(f"⚠ Package {pkg} not found in mirror {mirror}")
+    finally:
+        stop.set()
+
+def download_package_from(mirror, pkg, sig=None, timeout=None, gpg_dir=None):
+    # Önce imza indirilir, ardından paket tek geçişte diske yazılır, sha256'sı hesaplanır ve
+    # gpg_dir verilmişse aynı baytlar gpg --verify'a aktarılır. Başarıda paketin sha256'sı döner.
+    base = mirror.rstrip('/')
+    if sig and not download_file(f"{base}/{sig}", sig, timeout, mirror):
+        return None
+
+    digest = hashlib.sha256()
+    proc = None
+    if gpg_dir:
+        proc = subprocess.Popen(
+            ["gpg", "--homedir", gpg_dir, "--batch", "--verify", str(CACHE_DIR / sig), "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+
+    def sink(chunk):
+        digest.update(chunk)
+        if proc:
+            # gpg erken çıkarsa (bozuk imza) BrokenPipeError indirmeyi hemen durdurur
+            proc.stdin.write(chunk)
+
+    ok = download_file(f"{base}/{pkg}", pkg, timeout, mirror, sink)
+    if proc:
+        if not ok and proc.poll() is None:
+            # İndirme kendi hatasıyla bitti (download_file raporladı); gpg'nin yarım
+            # girdiye vereceği hüküm anlamsız, süreci sonlandır
+            proc.kill()
+            proc.wait()
+            return None
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        stderr = proc.stderr.read().decode(errors="replace")
+        proc.wait()
+        if proc.returncode != 0:
+            report_verify_failure(stderr)
+            # Reddedilen aynanın baytları bir sonraki aynada devam ettirilmesin
+            (CACHE_DIR / pkg).unlink(missing_ok=True)
+            (CACHE_DIR / (pkg + ".part")).unlink(missing_ok=True)
+            (CACHE_DIR / (pkg + ".part.validator")).unlink(missing_ok=True)
+            (CACHE_DIR / (pkg + ".validator")).unlink(missing_ok=True)
+            return None
+    return digest.hexdigest() if ok else None
+
+def download_from_mirrors(pkg, sig, target_repo=None, release_type=None, query_string=None, use_autoindex=False,
+                          parallel=False, fanout=MIRROR_FANOUT, timeout=MIRROR_TIMEOUT, gpg_dir=None):
+    # Başarıda (paketin sha256'sı, paketi veren mirror), başarısızlıkta (None, None) döndürür
     mirrors = read_mirrors(target_repo, release_type, query_string)
+    if parallel:
+        print(f"\U0001F310 Racing {len(mirrors)} mirrors (fan-out: {fanout}, timeout: {timeout}s)")
+        for mirror in race_mirrors(mirrors, pkg, use_autoindex, fanout, timeout):
+            print(f"\U0001F310 Fastest mirror: {mirror}")
+            pkg_hash = download_package_from(mirror, pkg, sig, timeout, gpg_dir)
+            if pkg_hash:
+                return pkg_hash, mirror
+            print(f"❌ Mirror failed: {mirror}")
+        return None, None
+
     for mirror in mirrors:
         print(f"\U0001F310 Trying mirror: {mirror}")
         file_list = None
@@ -143,41 +647,78 @@ def download_from_mirrors(pkg, sig, target_repo=None, release_type=None, query_s
                 print(f"⚠ Package {pkg} not found in mirror {mirror}, trying next...")
                 continue
 
-        pkg_url = f"{mirror.rstrip('/')}/{pkg}"
-        sig_url = f"{mirror.rstrip('/')}/{sig}"
-
-        success_pkg = download_file(pkg_url, pkg)
-        success_sig = download_file(sig_url, sig)
-
-        if success_pkg and success_sig:
-            return True
+        pkg_hash = download_package_from(mirror, pkg, sig, gpg_dir=gpg_dir)
+        if pkg_hash:
+            return pkg_hash, mirror
         else:
             print(f"❌ Mirror failed: {mirror}")
-    return False
+    return None, None
 
 
+def keyring_fingerprint():
+    # Keyring dizinindeki .asc dosyalarının adı ve içeriğinden tek bir özet üret
+    digest = hashlib.sha256()
+    for asc in sorted(os.listdir(KEYRING_PATH)):
+        if asc.endswith(".asc"):
+            digest.update(asc.encode() + b"\0")
+            with open(os.path.join(KEYRING_PATH, asc), "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
 
 def prepare_gpg_env():
-    # 1) GPG dizinini oluştur
-    os.makedirs(GPG_DIR, exist_ok=True)
+    # Hazırlanmış keyring, .asc dosyaları değişmediği sürece yeniden kullanılır
+    import fcntl
+    import tempfile
+
+    fingerprint = keyring_fingerprint()
+    stamp_path = os.path.join(GPG_DIR, "keyring.sha256")
+    parent = os.path.dirname(GPG_DIR)
+    os.makedirs(parent, exist_ok=True)
+    with open(GPG_DIR + ".lock", "w") as lock:
+        # Kontrol ve yeniden kurulum özel kilit altında; eşzamanlı kurulumlar aynı
+        # dizini aynı anda silip yeniden adlandırmaz, sırayla bekleyip hazır keyring'i kullanır
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(stamp_path):
+            with open(stamp_path, "r") as f:
+                if f.read().strip() == fingerprint:
+                    return GPG_DIR
+
+        # 1) Yeni keyring'i geçici bir dizinde hazırla
+        build_dir = tempfile.mkdtemp(prefix=".archcraftpkg_gpg.", dir=parent)
+        try:
+            # 2) Anahtarları import et
+            import_keyring(build_dir)
+
+            # 3) Import edilen anahtarları trust et
+            trust_all_keys(build_dir)
 
-    # 2) Anahtarları import et
-    import_keyring(GPG_DIR)
+            with open(os.path.join(build_dir, "keyring.sha256"), "w") as f:
+                f.write(fingerprint + "\n")
+        except Exception:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
 
-    # 3) Import edilen anahtarları trust et
-    trust_all_keys(GPG_DIR)
+        # 4) Eski keyring'i yenisiyle değiştir
+        shutil.rmtree(GPG_DIR, ignore_errors=True)
+        os.rename(build_dir, GPG_DIR)
+    return GPG_DIR
 
 def import_keyring(gpg_dir):
-    for asc in os.listdir(KEYRING_PATH):
+    asc_paths = []
+    for asc in sorted(os.listdir(KEYRING_PATH)):
         if asc.endswith(".asc"):
             asc_path = os.path.join(KEYRING_PATH, asc)
             print(f"Importing key: {asc_path}")
-            subprocess.run(
-                ["gpg", "--homedir", gpg_dir, "--import", asc_path],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
+            asc_paths.append(asc_path)
+    if not asc_paths:
+        return
+    # Tüm anahtarlar tek bir gpg çağrısıyla import edilir
+    subprocess.run(
+        ["gpg", "--homedir", gpg_dir, "--batch", "--import", *asc_paths],
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
 
 def trust_all_keys(gpg_dir):
     # Anahtarları listele
@@ -189,11 +730,16 @@ def trust_all_keys(gpg_dir):
     )
 
     trust_lines = []
+    in_pub = False
     for line in proc.stdout.splitlines():
         if line.startswith("pub"):
-            keyid = line.split(":")[4]
+            in_pub = True
+        elif line.startswith("fpr") and in_pub:
+            # --import-ownertrust parmak izi bekler, kısa key id değil
+            fingerprint = line.split(":")[9]
             # 6 = ultimate trust
-            trust_lines.append(f"{keyid}:6:\n")
+            trust_lines.append(f"{fingerprint}:6:\n")
+            in_pub = False
 
     trust_data = "".join(trust_lines)
 
@@ -214,28 +760,145 @@ def verify(pkg, gpg_dir):
         )
         return True
     except subprocess.CalledProcessError as e:
-        print(" GPG verification failed.")
-        print("📛 MTF GTLOB server = Go to the lie server, optional preparation is 522. The MTF GTLOB server error is a mistake, but it happens because the server manipulates the content. Since we use GitLab-like infrastructures, more problems may be experienced with the “more trash file” tool. This error will be solved when we have a new infrastructure. If you encounter problems with GPG signature validation due to package losses in GitLab, please contact admin@azccriminal.space.")
-        print("stderr:", e.stderr)
+        report_verify_failure(e.stderr)
+
+def report_verify_failure(stderr):
+    print(" GPG verification failed.")
+    print("📛 MTF GTLOB server = Go to the lie server, optional preparation is 522. The MTF GTLOB server error is a mistake, but it happens because the server manipulates the content. Since we use GitLab-like infrastructures, more problems may be experienced with the “more trash file” tool. This error will be solved when we have a new infrastructure. If you encounter problems with GPG signature validation due to package losses in GitLab, please contact admin@azccriminal.space.")
+    print("stderr:", stderr)
+
+def path_within(root, path):
+    return path == root or path.startswith(root + os.sep)
+
+def safe_member_path(dest, name):
+    # Mutlak yolları ve ".." bileşenlerini reddet; üst dizin diskte (bu ya da daha önce
+    # açılmış bir paketin) symlink'i üzerinden dest dışına çıkıyorsa da reddet
+    parts = [part for part in name.split("/") if part not in ("", ".")]
+    if name.startswith("/") or ".." in parts or not parts:
+        raise ValueError(f"unsafe path in archive: {name}")
+    path = os.path.join(dest, *parts)
+    if not path_within(os.path.realpath(dest), os.path.realpath(os.path.dirname(path))):
+        raise ValueError(f"archive member escapes through symlink: {name}")
+    return path, "/".join(parts)
+
+def prepare_member(dest, member):
+    # Üyeyi yazmadan önce yolunu doğrula ve yerindeki dosya/symlink'i kaldır ki
+    # yazma işlemi var olan bir symlink'i izleyip dest dışına taşmasın
+    path, rel = safe_member_path(dest, member.name)
+    root = os.path.realpath(dest)
+    if member.isdir():
+        if not path_within(root, os.path.realpath(path)):
+            raise ValueError(f"archive member escapes through symlink: {member.name}")
+        return path, rel
+    if member.islnk():
+        target, _ = safe_member_path(dest, member.linkname)
+        if not path_within(root, os.path.realpath(target)):
+            raise ValueError(f"archive hardlink escapes through symlink: {member.name}")
+    if os.path.islink(path) or (os.path.lexists(path) and not os.path.isdir(path)):
+        os.unlink(path)
+    return path, rel
+
+def write_member_file(path, data, member, chown):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o600)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        if chown:
+            os.fchown(fd, member.uid, member.gid)
+        os.fchmod(fd, member.mode & 0o7777)
+        os.utime(fd, (member.mtime, member.mtime))
+    finally:
+        os.close(fd)
+
+def extract_parallel(tar, dest, threads):
+    # Tek okuyucu arşivi akıtır; küçük düzenli dosyalar iş parçacıklarına dağıtılır.
+    # Dizinler okuyucuda oluşturulur, kipleri en sonda (içerik yazıldıktan sonra) ayarlanır.
+    from concurrent.futures import ThreadPoolExecutor
+
+    chown = os.geteuid() == 0
+    files = []
+    directories = []
+    pending = {}
+    inflight = threading.BoundedSemaphore(threads * 4)
+
+    def write_task(path, data, member):
+        try:
+            write_member_file(path, data, member, chown)
+        finally:
+            inflight.release()
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for member in tar:
+            files.append(member.name)
+            path, rel = prepare_member(dest, member)
+            if member.isdir():
+                os.makedirs(path, exist_ok=True)
+                directories.append((path, member))
+                continue
 
-def extract(pkg):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if member.isreg():
+                f = tar.extractfile(member)
+                if member.size > EXTRACT_SMALL_FILE:
+                    with open(path, "wb") as out_file:
+                        shutil.copyfileobj(f, out_file, DOWNLOAD_CHUNK_SIZE)
+                    if chown:
+                        os.chown(path, member.uid, member.gid)
+                    os.chmod(path, member.mode & 0o7777)
+                    os.utime(path, (member.mtime, member.mtime))
+                    continue
+                data = f.read()
+                inflight.acquire()
+                pending[rel] = executor.submit(write_task, path, data, member)
+            elif member.issym():
+                os.symlink(member.linkname, path)
+            elif member.islnk():
+                target, target_rel = safe_member_path(dest, member.linkname)
+                # Hedef dosya henüz yazılıyorsa bitmesini bekle
+                if target_rel in pending:
+                    pending.pop(target_rel).result()
+                os.link(target, path)
+            else:
+                tar.extract(member, path=dest)
+
+        for future in pending.values():
+            future.result()
+
+    for path, member in reversed(directories):
+        os.chmod(path, member.mode & 0o7777)
+        os.utime(path, (member.mtime, member.mtime))
+    return files
+
+def extract(pkg, threads=None):
+    import tarfile
+
+    threads = EXTRACT_THREADS if threads is None else threads
     pkg_path = CACHE_DIR / pkg
 
-    tar_path = CACHE_DIR / pkg.replace(".zst", "")
+    # zstd çıktısı doğrudan tarfile akışına bağlanır, ara .tar dosyası yazılmaz
+    proc = subprocess.Popen(
+        ["zstd", "-d", "-c", "-q", str(pkg_path)],
+        stdout=subprocess.PIPE
+    )
+    files = []
     try:
-        subprocess.run(
-            ["zstd", "-d", "-f", str(pkg_path), "-o", str(tar_path)],
-            check=True
-        )
-    except subprocess.CalledProcessError as e:
+        with tarfile.open(fileobj=proc.stdout, mode="r|", bufsize=DOWNLOAD_CHUNK_SIZE) as tar:
+            if threads > 1:
+                files = extract_parallel(tar, str(CACHE_DIR), threads)
+            else:
+                for member in tar:
+                    files.append(member.name)
+                    prepare_member(str(CACHE_DIR), member)
+                    tar.extract(member, path=CACHE_DIR)
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+
+    if returncode != 0:
+        e = subprocess.CalledProcessError(returncode, proc.args)
         print(f"❌ Zstd decompression failed: {e}")
-        raise
-
-    with tarfile.open(tar_path, "r:") as tar:
-        files = tar.getnames()
-        tar.extractall(path=CACHE_DIR)
-
-    os.remove(tar_path)
+        raise e
 
     # Ana dizini tespit et
     top_level_dirs = set(f.split('/')[0] for f in files if '/' in f)
@@ -247,98 +910,502 @@ def extract(pkg):
     return files, extract_dir
 
 
-def install(pkgname, repo=None, release=None, no_secure=False, query_string=None, ntp_sync_flag=False, use_autoindex=False):
-    if ntp_sync_flag:
-        ntp_sync()
-
+def fetch_package(pkgname, repo=None, release=None, no_secure=False, query_string=None, use_autoindex=False,
+                  parallel=False, fanout=MIRROR_FANOUT, timeout=MIRROR_TIMEOUT, gpg_dir=None):
+    # (sha256, mirror) ya da (None, None) döndürür; gpg_dir verilirse imza indirme sırasında doğrulanır
     pkg = f"{pkgname}.pkg.tar.zst"
     sig = pkg + ".sig"
 
-    pkg_path = CACHE_DIR / pkg
-    sig_path = CACHE_DIR / sig
-
     # Download the package and its signature
     if not no_secure:
-        if not download_from_mirrors(pkg, sig, repo, release, query_string, use_autoindex):
-            print("❌ Failed to download the package or signature.")
-            sys.exit(1)
+        pkg_hash, mirror = download_from_mirrors(pkg, sig, repo, release, query_string, use_autoindex,
+                                                 parallel, fanout, timeout, gpg_dir)
+        if not pkg_hash:
+            print(f"❌ Failed to download the package or signature: {pkgname}")
+        return pkg_hash, mirror
 
-        with tempfile.TemporaryDirectory() as gpg_dir:
-            import_keyring(gpg_dir)
-            try:
-                verify(str(pkg_path), gpg_dir)
-            except subprocess.CalledProcessError:
-                print("❌ PGP verification failed!")
-                sys.exit(1)
-    else:
-        mirrors = read_mirrors(repo, release, query_string)
-        success = False
-        for mirror in mirrors:
-            try:
-                print(f"\U0001F310 Trying mirror without PGP: {mirror}")
-                urllib.request.urlretrieve(f"{mirror.rstrip('/')}/{pkg}", str(pkg_path))
-                success = True
-                print("⚠ Warning: Downloaded without PGP signature verification!")
+    mirrors = read_mirrors(repo, release, query_string)
+    for mirror in mirrors:
+        print(f"\U0001F310 Trying mirror without PGP: {mirror}")
+        # download_file dosyayı yerinde değiştirmez; CACHE_DIR'daki önbellek hard link'leri bozulmaz
+        pkg_hash = download_package_from(mirror, pkg)
+        if pkg_hash:
+            print("⚠ Warning: Downloaded without PGP signature verification!")
+            return pkg_hash, mirror
+        print(f"❌ Mirror failed: {mirror}")
+    print(f"❌ Failed to download the package: {pkgname}")
+    return None, None
+
+def pkgdb_connect():
+    import sqlite3
+
+    os.makedirs(PKG_DB_FILE.parent, exist_ok=True)
+    conn = sqlite3.connect(str(PKG_DB_FILE), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    with conn:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS packages (
+                name TEXT PRIMARY KEY,
+                version TEXT,
+                repo TEXT,
+                release TEXT,
+                hash TEXT,
+                installed REAL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT NOT NULL,
+                package TEXT NOT NULL REFERENCES packages(name) ON DELETE CASCADE,
+                is_dir INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (path, package)
+            );
+            CREATE INDEX IF NOT EXISTS files_by_package ON files(package);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        migrated = conn.execute("SELECT value FROM meta WHERE key = 'legacy_migrated'").fetchone()
+        if not migrated:
+            pkgdb_migrate_legacy(conn)
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('legacy_migrated', ?)", (str(time.time()),))
+    return conn
+
+def pkgdb_migrate_legacy(conn):
+    # Paket başına bir metin dosyası tutan eski PKG_DB düzenini içe aktar
+    if not PKG_DB.is_dir():
+        return
+    for entry in sorted(PKG_DB.iterdir()):
+        if not entry.is_file():
+            continue
+        with open(entry, "r") as f:
+            paths = [line.strip() for line in f if line.strip()]
+        print(f"↪ Migrating package record: {entry.name}")
+        pkgdb_write(conn, entry.name, paths, installed=entry.stat().st_mtime)
+
+def pkgdb_write(conn, pkgname, paths, version=None, repo=None, release=None, pkg_hash=None, installed=None):
+    # Başka bir yolun atası olan yollar dizindir; çakışma kontrolünde sayılmazlar
+    parents = set()
+    for path in paths:
+        parent = os.path.dirname(path.rstrip("/"))
+        while parent and parent not in parents and parent != "/":
+            parents.add(parent)
+            parent = os.path.dirname(parent)
+    conn.execute("DELETE FROM files WHERE package = ?", (pkgname,))
+    conn.execute(
+        "INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?, ?)",
+        (pkgname, version, repo, release, pkg_hash, installed or time.time())
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO files VALUES (?, ?, ?)",
+        ((path.rstrip("/") or "/", pkgname, int(path.rstrip("/") in parents)) for path in paths)
+    )
+
+def pkgdb_packages():
+    conn = pkgdb_connect()
+    try:
+        return [row[0] for row in conn.execute("SELECT name FROM packages ORDER BY name")]
+    finally:
+        conn.close()
+
+def pkgdb_package_info():
+    conn = pkgdb_connect()
+    try:
+        return {
+            row[0]: {"version": row[1], "repo": row[2], "release": row[3], "hash": row[4]}
+            for row in conn.execute("SELECT name, version, repo, release, hash FROM packages ORDER BY name")
+        }
+    finally:
+        conn.close()
+
+def pkgdb_files(conn, pkgname):
+    if not conn.execute("SELECT 1 FROM packages WHERE name = ?", (pkgname,)).fetchone():
+        return None
+    return conn.execute(
+        "SELECT path, is_dir FROM files WHERE package = ? ORDER BY path", (pkgname,)
+    ).fetchall()
+
+def pkgdb_owners(path):
+    conn = pkgdb_connect()
+    try:
+        return [row[0] for row in conn.execute("SELECT package FROM files WHERE path = ?", (path.rstrip("/") or "/",))]
+    finally:
+        conn.close()
+
+def pkgdb_shared_paths(conn, pkgname):
+    # Paketin yollarından başka paketlerin de sahip olduklarını döndürür
+    return {row[0] for row in conn.execute("""
+        SELECT DISTINCT o.path FROM files f JOIN files o ON o.path = f.path
+        WHERE f.package = ? AND o.package != ?
+    """, (pkgname, pkgname))}
+
+def pkgdb_owned_below(conn, pkgname):
+    # Paketin, altında başka bir pakete ait yol bulunan yolları (dizinleri) döndürür.
+    # "<yol>/" <= p < "<yol>0" aralığı ('0', '/'dan sonraki karakter) files birincil
+    # anahtarı üzerinden taranır; LIKE gibi tüm tabloyu dolaşmaz.
+    return {row[0] for row in conn.execute("""
+        SELECT f.path FROM files f
+        WHERE f.package = ? AND EXISTS (
+            SELECT 1 FROM files o
+            WHERE o.path >= f.path || '/' AND o.path < f.path || '0' AND o.package != ?
+        )
+    """, (pkgname, pkgname))}
+
+def pkgdb_conflicts(conn, pkgname, paths):
+    # Başka paketlere ait, dizin olmayan yolları döndürür
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (path TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM incoming")
+    conn.executemany("INSERT OR IGNORE INTO incoming VALUES (?)", ((path.rstrip("/") or "/",) for path in paths))
+    return conn.execute("""
+        SELECT f.path, f.package FROM files f JOIN incoming i ON i.path = f.path
+        WHERE f.package != ? AND f.is_dir = 0
+        ORDER BY f.path
+    """, (pkgname,)).fetchall()
+
+def pkgdb_hashes():
+    conn = pkgdb_connect()
+    try:
+        return {row[0] for row in conn.execute("SELECT hash FROM packages WHERE hash IS NOT NULL")}
+    finally:
+        conn.close()
+
+def pkgdb_remove(conn, pkgname):
+    with conn:
+        conn.execute("DELETE FROM packages WHERE name = ?", (pkgname,))
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_pkgver(extract_dir):
+    # Paketin MAKEPKGBUILD dosyasındaki pkgver değeri
+    makepkgbuild = Path(extract_dir) / "MAKEPKGBUILD"
+    if not makepkgbuild.is_file():
+        return None
+    with open(makepkgbuild, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip().startswith("pkgver="):
+                return line.split("=", 1)[1].strip().strip('"').strip("'")
+    return None
+
+def register_package(pkgname, files, repo=None, release=None, pkg_hash=None, version=None):
+    # Save the file list to the package database, unless it clashes with another package
+    paths = [f"/{path}" for path in files]
+    conn = pkgdb_connect()
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conflicts = pkgdb_conflicts(conn, pkgname, paths)
+            if not conflicts:
+                pkgdb_write(conn, pkgname, paths, version, repo, release, pkg_hash)
+        return conflicts
+    finally:
+        conn.close()
+
+def load_pkg_cache_index():
+    try:
+        with open(PKG_CACHE_DIR / "index.json", "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {"packages": {}, "blobs": {}}
+
+def save_pkg_cache_index(index):
+    os.makedirs(PKG_CACHE_DIR, exist_ok=True)
+    tmp_path = PKG_CACHE_DIR / "index.json.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, PKG_CACHE_DIR / "index.json")
+
+def link_or_copy(src, dest):
+    # Aynı inode'a bağlı iki yol arasında rename hiçbir şey yapmaz, önceden kontrol et
+    if os.path.exists(dest) and os.path.samefile(src, dest):
+        return
+    tmp_dest = f"{dest}.tmp"
+    try:
+        os.link(src, tmp_dest)
+    except OSError:
+        shutil.copyfile(src, tmp_dest)
+    os.replace(tmp_dest, dest)
+
+def cache_revalidate(entry):
+    # Önbellekteki kopya, indirildiği URL'deki dosyayla hâlâ aynı mı? (HEAD + ETag/Last-Modified)
+    if not entry.get("source") or not entry.get("validator"):
+        return False
+    try:
+        with http_open(entry["source"], timeout=MIRROR_TIMEOUT, method="HEAD") as response:
+            return response_validator(response) == entry["validator"]
+    except Exception:
+        return False
+
+def cache_lookup(pkgname, pkg_hash=None):
+    # Önbellekte doğrulanmış bir kopya varsa CACHE_DIR'a bağlar ve hash'ini döndürür.
+    # pkg_hash (snapshot'tan) verilirse tam olarak o içerik aranır. Yalnızca paket adı
+    # biliniyorsa son kopya, mirror'daki dosya değişmediği HEAD ile doğrulanınca kullanılır;
+    # aksi halde yeni sürüm hiç indirilmezdi.
+    if PKG_CACHE_BYPASS:
+        return None
+    pkg = f"{pkgname}.pkg.tar.zst"
+    if not pkg_hash:
+        with pkg_cache_lock:
+            index = load_pkg_cache_index()
+            pkg_hash = index["packages"].get(pkgname)
+            entry = index["blobs"].get(pkg_hash, {})
+        if not pkg_hash:
+            return None
+        if not INDEX_OFFLINE and not cache_revalidate(entry):
+            print(f"↻ Cached {pkg} is outdated or could not be revalidated, downloading")
+            return None
+    with pkg_cache_lock:
+        index = load_pkg_cache_index()
+        blob = PKG_CACHE_DIR / f"{pkg_hash}.pkg.tar.zst"
+        if not blob.exists() or not Path(f"{blob}.sig").exists():
+            return None
+        if file_sha256(blob) != pkg_hash:
+            print(f"⚠ Cached package is corrupted, discarding: {pkg}")
+            for path in (blob, Path(f"{blob}.sig")):
+                path.unlink(missing_ok=True)
+            return None
+        link_or_copy(blob, CACHE_DIR / pkg)
+        link_or_copy(f"{blob}.sig", CACHE_DIR / f"{pkg}.sig")
+        index["blobs"].setdefault(pkg_hash, {})["last_used"] = time.time()
+        save_pkg_cache_index(index)
+    print(f"♻ Using cached package: {pkg} ({pkg_hash[:12]})")
+    return pkg_hash
+
+def cache_origin(pkg_hash):
+    # Önbellekteki kopyanın geldiği (repo, release)
+    with pkg_cache_lock:
+        blob = load_pkg_cache_index()["blobs"].get(pkg_hash, {})
+    return blob.get("repo"), blob.get("release")
+
+def cache_store(pkgname, pkg_hash, origin=(None, None), source=None):
+    # source: paketin indirildiği URL; download_file'ın bıraktığı doğrulayıcıyla birlikte
+    # saklanır ki sonraki ad ile aramalar mirror'daki dosyanın değişip değişmediğini sorabilsin
+    pkg = f"{pkgname}.pkg.tar.zst"
+    blob = PKG_CACHE_DIR / f"{pkg_hash}.pkg.tar.zst"
+    validator_path = CACHE_DIR / f"{pkg}.validator"
+    validator = validator_path.read_text().strip() if source and validator_path.exists() else None
+    with pkg_cache_lock:
+        os.makedirs(PKG_CACHE_DIR, exist_ok=True)
+        if not blob.exists():
+            link_or_copy(CACHE_DIR / pkg, blob)
+        link_or_copy(CACHE_DIR / f"{pkg}.sig", f"{blob}.sig")
+        index = load_pkg_cache_index()
+        index["packages"][pkgname] = pkg_hash
+        index["blobs"][pkg_hash] = {
+            "name": pkgname,
+            "size": blob.stat().st_size + os.path.getsize(f"{blob}.sig"),
+            "last_used": time.time(),
+            "repo": origin[0],
+            "release": origin[1],
+            "source": source,
+            "validator": validator,
+        }
+        save_pkg_cache_index(index)
+
+def cache_prune(budget=None):
+    # Kurulu paketlere ait olmayan blob'ları en eski kullanılandan başlayarak sil
+    budget = PKG_CACHE_BUDGET if budget is None else budget
+    pinned = pkgdb_hashes()
+    freed = 0
+    with pkg_cache_lock:
+        index = load_pkg_cache_index()
+        total = sum(blob["size"] for blob in index["blobs"].values())
+        candidates = sorted(
+            (h for h in index["blobs"] if h not in pinned),
+            key=lambda h: index["blobs"][h]["last_used"]
+        )
+        for pkg_hash in candidates:
+            if total <= budget:
                 break
+            entry = index["blobs"].pop(pkg_hash)
+            blob = PKG_CACHE_DIR / f"{pkg_hash}.pkg.tar.zst"
+            loose = CACHE_DIR / f"{entry['name']}.pkg.tar.zst"
+            for path in (blob, Path(f"{blob}.sig")):
+                path.unlink(missing_ok=True)
+            # CACHE_DIR içindeki hard link de silinmezse yer açılmaz
+            if loose.exists() and not loose.is_symlink() and index["packages"].get(entry["name"]) == pkg_hash:
+                loose.unlink()
+                Path(f"{loose}.sig").unlink(missing_ok=True)
+            if index["packages"].get(entry["name"]) == pkg_hash:
+                del index["packages"][entry["name"]]
+            total -= entry["size"]
+            freed += entry["size"]
+            print(f"🗑 Evicted cached package: {entry['name']} ({pkg_hash[:12]})")
+        save_pkg_cache_index(index)
+    return freed
+
+def cache_list():
+    index = load_pkg_cache_index()
+    pinned = pkgdb_hashes()
+    total = 0
+    for pkg_hash, entry in sorted(index["blobs"].items(), key=lambda e: e[1]["last_used"], reverse=True):
+        total += entry["size"]
+        mark = "📌" if pkg_hash in pinned else "  "
+        used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["last_used"]))
+        print(f"{mark} {entry['name']:<32} {entry['size'] / 1024 ** 2:>9.1f} MiB  {used}  {pkg_hash[:12]}")
+    print(f"Total: {total / 1024 ** 2:.1f} MiB / budget {PKG_CACHE_BUDGET / 1024 ** 2:.0f} MiB")
+
+def install_pipeline(pkgnames, repo=None, release=None, no_secure=False, query_string=None,
+                     use_autoindex=False, parallel=False, fanout=MIRROR_FANOUT, timeout=MIRROR_TIMEOUT,
+                     expected_hashes=None):
+    # Paketleri indirir, doğrular, açar ve kaydeder; (extract_dirs, failed) döndürür.
+    # failed: paket adı -> hata nedeni. expected_hashes verilirse paket içeriği bu hash'le eşleşmelidir.
+    from concurrent.futures import ThreadPoolExecutor
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    expected_hashes = expected_hashes or {}
+    gpg_dir = None if no_secure else prepare_gpg_env()
+
+    # download -> verify -> extract -> PKG_DB aşamaları paketler arasında örtüşür,
+    # her aşamanın eşzamanlılığı kendi semaforu ile sınırlanır
+    slots = {
+        "download": threading.BoundedSemaphore(DOWNLOAD_WORKERS),
+        "verify": threading.BoundedSemaphore(VERIFY_WORKERS),
+        "extract": threading.BoundedSemaphore(EXTRACT_WORKERS),
+    }
+
+    def pipeline(pkgname):
+        pkg = f"{pkgname}.pkg.tar.zst"
+        expected_hash = expected_hashes.get(pkgname)
+        pkg_hash = cache_lookup(pkgname, expected_hash)
+        downloaded = not pkg_hash
+        # STREAM_VERIFY açıkken imza indirme sırasında doğrulanır, ayrı verify aşaması atlanır
+        streamed = downloaded and gpg_dir is not None and STREAM_VERIFY
+        if downloaded:
+            with slots["download"]:
+                pkg_hash, mirror = fetch_package(pkgname, repo, release, no_secure, query_string, use_autoindex,
+                                                 parallel, fanout, timeout, gpg_dir if streamed else None)
+            if not pkg_hash:
+                raise RuntimeError("download failed")
+            # Snapshot'lar için CLI filtresi değil, paketi gerçekten veren mirror'ın repo/release'i kaydedilir
+            origin = mirror_origin(mirror)
+        else:
+            origin = cache_origin(pkg_hash)
+        if origin == (None, None):
+            origin = (repo, release)
+        if gpg_dir and not streamed:
+            with slots["verify"]:
+                if not verify(str(CACHE_DIR / pkg), gpg_dir):
+                    raise RuntimeError("PGP verification failed")
+        # Sadece imzası doğrulanmış paketler önbelleğe alınır
+        if downloaded and gpg_dir:
+            cache_store(pkgname, pkg_hash, origin, f"{mirror.rstrip('/')}/{pkg}")
+        if expected_hash and pkg_hash != expected_hash:
+            raise RuntimeError(f"hash mismatch: mirror has {pkg_hash[:12]}, expected {expected_hash[:12]}")
+        with slots["extract"]:
+            files, extract_dir = extract(pkg)
+        conflicts = register_package(pkgname, files, origin[0], origin[1], pkg_hash, read_pkgver(extract_dir))
+        if conflicts:
+            for path, owner in conflicts:
+                print(f"❌ File conflict: {path} is owned by {owner}")
+            raise RuntimeError(f"{len(conflicts)} file conflict(s)")
+        return extract_dir
+
+    extract_dirs = {}
+    failed = {}
+    workers = min(len(pkgnames), DOWNLOAD_WORKERS + VERIFY_WORKERS + EXTRACT_WORKERS)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {pkgname: executor.submit(pipeline, pkgname) for pkgname in pkgnames}
+        for pkgname, future in futures.items():
+            try:
+                extract_dirs[pkgname] = future.result()
             except Exception as e:
-                print(f"❌ Mirror failed: {e}")
-        if not success:
-            print("❌ Failed to download the package.")
-            sys.exit(1)
+                print(f"❌ Installation failed: {pkgname} ({e})")
+                failed[pkgname] = str(e)
+
+    cache_prune()
+    return extract_dirs, failed
+
+def run_makepkgbuild(extract_dir):
+    print(f"🔧 Running makepkgbuild in {extract_dir} ...")
+    subprocess.run(["makepkgbuild"], cwd=str(extract_dir), check=True)
 
-    # Extract package
-    files, extract_dir = extract(pkg)
+def install_many(pkgnames, repo=None, release=None, no_secure=False, query_string=None, ntp_sync_flag=False,
+                 use_autoindex=False, parallel=False, fanout=MIRROR_FANOUT, timeout=MIRROR_TIMEOUT,
+                 assume_yes=False):
+    if ntp_sync_flag:
+        ntp_sync()
 
-    # Save the file list to PKG_DB
-    os.makedirs(PKG_DB, exist_ok=True)
-    pkgdb_file = PKG_DB / pkgname
-    with pkgdb_file.open("w") as f:
-        for path in files:
-            f.write(f"/{path}\n")
+    extract_dirs, failed = install_pipeline(pkgnames, repo, release, no_secure, query_string,
+                                            use_autoindex, parallel, fanout, timeout)
+
+    if failed:
+        print(f"❌ Failed packages: {', '.join(failed)}")
+    if not extract_dirs:
+        sys.exit(1)
 
     # Ask user whether to continue with makepkgbuild
-    user_input = input(f"📦 Is the package buildcrafting? [y/N]: ").strip().lower()
+    if len(extract_dirs) > 1:
+        print(f"📦 Ready: {', '.join(extract_dirs)}")
+    if assume_yes:
+        user_input = "y"
+    else:
+        user_input = input(f"📦 Is the package buildcrafting? [y/N]: ").strip().lower()
     if user_input == "y":
-        try:
-            print(f"🔧 Running makepkgbuild in {extract_dir} ...")
-            subprocess.run(["makepkgbuild"], cwd=str(extract_dir), check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"❌ makepkgbuild failed: {e}")
-            sys.exit(1)
+        for pkgname, extract_dir in extract_dirs.items():
+            try:
+                run_makepkgbuild(extract_dir)
+            except subprocess.CalledProcessError as e:
+                print(f"❌ makepkgbuild failed: {e}")
+                sys.exit(1)
+            print(f"✅ Installed: {pkgname}")
     else:
         print("⛔ Installation cancelled by user.")
         sys.exit(0)
 
-    print(f"✅ Installed: {pkgname}")
+    if failed:
+        sys.exit(1)
+
+def install(pkgname, repo=None, release=None, no_secure=False, query_string=None, ntp_sync_flag=False, use_autoindex=False,
+            parallel=False, fanout=MIRROR_FANOUT, timeout=MIRROR_TIMEOUT, assume_yes=False):
+    install_many([pkgname], repo, release, no_secure, query_string, ntp_sync_flag, use_autoindex,
+                 parallel, fanout, timeout, assume_yes)
 
 
-def remove(pkgname):
-    dbfile = os.path.join(PKG_DB, pkgname)
-    if not os.path.exists(dbfile):
-        print("❌ Package not found in database.")
-        return
+def remove(pkgname, assume_yes=False):
+    import sqlite3
 
-    confirm = input("Packaging deleted All? [y/N]: ").strip().lower()
-    if confirm != "y":
-        print("⛔ Removal cancelled.")
-        return
+    conn = pkgdb_connect()
+    try:
+        entries = pkgdb_files(conn, pkgname)
+        if entries is None:
+            print("❌ Package not found in database.")
+            return
+
+        confirm = "y" if assume_yes else input("Packaging deleted All? [y/N]: ").strip().lower()
+        if confirm != "y":
+            print("⛔ Removal cancelled.")
+            return
 
-    print(f"🗑 Removing package: {pkgname}")
+        print(f"🗑 Removing package: {pkgname}")
+        shared = pkgdb_shared_paths(conn, pkgname)
+        owned_below = pkgdb_owned_below(conn, pkgname)
 
-    with open(dbfile, "r") as f:
-        for path in f.readlines():
-            path = path.strip()
-            if path.startswith("~"):
-                path = os.path.expanduser(path)
+        # En derin yollar önce silinir, böylece dizinler içerikleriyle birlikte kalmaz
+        for entry, is_dir in sorted(entries, key=lambda e: e[0].count("/"), reverse=True):
+            path = os.path.expanduser(entry) if entry.startswith("~") else entry
 
             if os.path.basename(path) == pkgname:
                 print(f"⚠ Skipping deletion of '{path}' because its name matches the package name.")
                 continue
 
+            if entry in shared:
+                print(f"⚠ Keeping '{path}', it is also owned by another package.")
+                continue
+
             if os.path.exists(path):
                 try:
-                    if os.path.isdir(path):
-                        shutil.rmtree(path, ignore_errors=True)
+                    if is_dir or os.path.isdir(path):
+                        # Dizinler yalnızca boşsa ve altında başka paketin yolu yoksa silinir
+                        if entry in owned_below:
+                            print(f"⚠ Keeping '{path}', another package owns files inside it.")
+                            continue
+                        try:
+                            os.rmdir(path)
+                        except OSError:
+                            print(f"⚠ Keeping '{path}', directory is not empty.")
+                            continue
                     else:
                         os.remove(path)
                     print(f"✔ Deleted: {path}")
@@ -347,14 +1414,28 @@ def remove(pkgname):
             else:
                 print(f"⚠ Path does not exist (already deleted?): {path}")
 
-    try:
-        os.remove(dbfile)
-    except Exception as e:
-        print(f"⚠ Failed to remove package database record: {e}")
-        return
+        try:
+            pkgdb_remove(conn, pkgname)
+        except sqlite3.Error as e:
+            print(f"⚠ Failed to remove package database record: {e}")
+            return
+    finally:
+        conn.close()
 
     print(f"✅ Package removed: {pkgname}")
 
+def owns(path):
+    owners = pkgdb_owners(os.path.abspath(os.path.expanduser(path)))
+    if not owners:
+        print(f"❌ No package owns {path}")
+        return
+    for owner in owners:
+        print(f"📦 {path} is owned by {owner}")
+
+def list_installed():
+    for pkgname in pkgdb_packages():
+        print(pkgname)
+
 def list_keyring():
     print("🔑 /etc/archcraft/keyring:")
     asc_files = glob.glob(os.path.join(KEYRING_PATH, "*.asc"))
@@ -372,7 +1453,96 @@ def list_keyring():
     for asc in asc_files:
         print(" -", os.path.basename(asc))
 
-def search(pkgname, repo=None, release=None, query_string=None, use_autoindex=False):
+def sync(query_string=None, use_autoindex=False):
+    # Her repo/release için ilk cevap veren mirror'ın listesini alıp tek bir indekste birleştir
+    groups = {}
+    for repo, release, _ in iter_mirrorlist():
+        groups.setdefault((repo, release), None)
+
+    packages = {}
+    for repo, release in groups:
+        location = f"{repo or '-'}/{release or '-'}"
+        for mirror in read_mirrors(repo, release, query_string):
+            # sync TTL'yi atlar, her zaman koşullu GET ile yeniden doğrular
+            if use_autoindex:
+                file_list = get_autoindex_file_list(mirror, revalidate=True)
+            else:
+                file_list = get_files_json(mirror, revalidate=True)
+            if file_list:
+                break
+        else:
+            print(f"⚠ No package list available for {location}")
+            continue
+        count = 0
+        for entry in file_list:
+            name = entry.get("name", "")
+            if name.endswith(".pkg.tar.zst"):
+                packages.setdefault(name[:-len(".pkg.tar.zst")], []).append(location)
+                count += 1
+        print(f"✔ {location}: {count} packages")
+
+    # Sıralı "ad<TAB>konumlar" satırları; yükleme tek okuma, önek araması bisect ile yapılır
+    tmp_path = SEARCH_INDEX.with_suffix(".tmp")
+    os.makedirs(SEARCH_INDEX.parent, exist_ok=True)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(SEARCH_INDEX_MAGIC + "\n")
+        for name in sorted(packages):
+            f.write(f"{name}\t{','.join(packages[name])}\n")
+    os.replace(tmp_path, SEARCH_INDEX)
+    print(f"✅ Synced {len(packages)} packages from {len(groups)} repositories")
+
+def load_search_index():
+    try:
+        with open(SEARCH_INDEX, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    if not lines or lines[0] != SEARCH_INDEX_MAGIC:
+        return None
+    names, locations = [], []
+    for line in lines[1:]:
+        name, _, where = line.partition("\t")
+        names.append(name)
+        locations.append(where)
+    return names, locations
+
+def search_index(query, names, fuzzy=False):
+    # Önce tam eşleşme ve önek (bisect), sonra alt dize, sonuç yoksa ya da istenirse bulanık eşleşme
+    import difflib
+
+    matches = {}
+    i = bisect.bisect_left(names, query)
+    while i < len(names) and names[i].startswith(query):
+        matches[i] = "exact" if names[i] == query else "prefix"
+        i += 1
+    for i, name in enumerate(names):
+        if i not in matches and query in name:
+            matches[i] = "substring"
+    if fuzzy or not matches:
+        for name in difflib.get_close_matches(query, names, n=10, cutoff=0.6):
+            i = bisect.bisect_left(names, name)
+            matches.setdefault(i, "fuzzy")
+    order = {"exact": 0, "prefix": 1, "substring": 2, "fuzzy": 3}
+    return sorted(matches.items(), key=lambda m: (order[m[1]], names[m[0]]))
+
+def search(pkgname, repo=None, release=None, query_string=None, use_autoindex=False, fuzzy=False):
+    index = load_search_index()
+    if index is not None:
+        names, locations = index
+        found = False
+        for i, kind in search_index(pkgname, names, fuzzy):
+            where = [
+                loc for loc in locations[i].split(",")
+                if (not repo or loc.split("/")[0] == repo) and (not release or loc.split("/")[1] == release)
+            ]
+            if where:
+                found = True
+                print(f"{'✅' if kind == 'exact' else '🔎'} {names[i]:<40} {', '.join(where)}  ({kind})")
+        if not found:
+            print("❌ Package not found in the local index (run 'apkg sync' to refresh).")
+        return
+
+    print("⚠ No local search index, querying mirrors (run 'apkg sync' for offline search).")
     mirrors = read_mirrors(repo, release, query_string)
 
     for mirror in mirrors:
@@ -387,8 +1557,7 @@ def search(pkgname, repo=None, release=None, query_string=None, use_autoindex=Fa
         # Fallback: Doğrudan URL kontrolü
         url = f"{mirror}/{pkgname}.pkg.tar.zst"
         try:
-            req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
-            with urllib.request.urlopen(req) as response:
+            with http_open(url, method="HEAD") as response:
                 if response.status == 200:
                     print(f"✅ FOUNDED PACKAGE : {pkgname}")
                     return
@@ -407,22 +1576,195 @@ def remove_cache():
         print("Cache directory does not exist.")
 
 def snapshot_save(filename):
-    packages = os.listdir(PKG_DB)
+    packages = pkgdb_package_info()
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "packages": [{"name": name, **info} for name, info in packages.items()],
+    }
     with open(filename, "w") as f:
-        for pkg in packages:
-            f.write(pkg + "\n")
+        json.dump(snapshot, f, indent=2)
+        f.write("\n")
     print(f"📦 Snapshot saved to {filename}")
 
-def snapshot_load(filename, repo=None, release=None, no_secure=False, query_string=None, ntp_sync_flag=False):
+def read_snapshot(filename):
+    # Yeni JSON biçimi ya da satır başına bir paket adı içeren eski biçim
+    with open(filename, "r") as f:
+        text = f.read()
+    if text.lstrip().startswith("{"):
+        snapshot = json.loads(text)
+        if snapshot.get("format", 0) > SNAPSHOT_FORMAT:
+            raise ValueError(f"unsupported snapshot format {snapshot['format']}")
+        entries = snapshot["packages"]
+    else:
+        entries = [{"name": line.strip()} for line in text.splitlines() if line.strip()]
+    return list({entry["name"]: entry for entry in entries}.values())
+
+def snapshot_plan(entries):
+    # Snapshot'a ulaşmak için gereken en küçük kurulum/kaldırma kümesi
+    installed = pkgdb_package_info()
+    installs, unchanged = [], []
+    for entry in entries:
+        current = installed.get(entry["name"])
+        if current is None:
+            installs.append((entry, "missing"))
+        elif entry.get("hash") and current["hash"] != entry["hash"]:
+            installs.append((entry, "hash differs"))
+        elif not entry.get("hash") and entry.get("version") and current["version"] != entry["version"]:
+            installs.append((entry, f"version {current['version']} → {entry['version']}"))
+        else:
+            unchanged.append(entry["name"])
+    wanted = {entry["name"] for entry in entries}
+    removals = [name for name in installed if name not in wanted]
+    return installs, removals, unchanged
+
+def print_snapshot_plan(installs, removals, unchanged):
+    for entry, reason in installs:
+        version = f" {entry['version']}" if entry.get("version") else ""
+        print(f"  + {entry['name']}{version} ({reason})")
+    for name in removals:
+        print(f"  - {name}")
+    print(f"Install: {len(installs)}, remove: {len(removals)}, unchanged: {len(unchanged)}")
+
+def snapshot_diff(filename):
+    if not os.path.exists(filename):
+        print(f"❌ Snapshot file not found: {filename}")
+        return
+    print_snapshot_plan(*snapshot_plan(read_snapshot(filename)))
+
+def batch_install(pkgnames, repo=None, release=None, no_secure=False, query_string=None,
+                  use_autoindex=False, parallel=False, fanout=MIRROR_FANOUT, timeout=MIRROR_TIMEOUT,
+                  expected_hashes=None):
+    # Soru sormadan kurar; paket adı -> hata nedeni döndürür
+    extract_dirs, failed = install_pipeline(pkgnames, repo, release, no_secure, query_string,
+                                            use_autoindex, parallel, fanout, timeout, expected_hashes)
+    for pkgname, extract_dir in extract_dirs.items():
+        try:
+            run_makepkgbuild(extract_dir)
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"❌ makepkgbuild failed: {e}")
+            failed[pkgname] = "makepkgbuild failed"
+    return failed
+
+def snapshot_load(filename, repo=None, release=None, no_secure=False, query_string=None, ntp_sync_flag=False,
+                  use_autoindex=False, parallel=False, fanout=MIRROR_FANOUT, timeout=MIRROR_TIMEOUT, batch=False):
     if not os.path.exists(filename):
         print(f"❌ Snapshot file not found: {filename}")
         return
-    with open(filename, "r") as f:
-        pkgs = [line.strip() for line in f if line.strip()]
+    pkgs = [entry["name"] for entry in read_snapshot(filename)]
+
+    # Zaten kurulu olan paketler atlanır
+    installed = set(pkgdb_packages())
+    todo = [pkg for pkg in pkgs if pkg not in installed]
+    skipped = [pkg for pkg in pkgs if pkg in installed]
+    for pkg in skipped:
+        print(f"⏭ Already installed: {pkg}")
+
+    if not batch:
+        for pkg in todo:
+            print(f"📦 Installing from snapshot: {pkg}")
+            install(pkg, repo, release, no_secure, query_string, ntp_sync_flag, use_autoindex,
+                    parallel, fanout, timeout)
+        return
+
+    # Toplu mod: soru sorulmaz, paketler birlikte indirilir, hata ilk pakette durdurmaz
+    if ntp_sync_flag:
+        ntp_sync()
+    print(f"📦 Restoring {len(todo)} packages from snapshot ({len(skipped)} already installed)")
+    failed = batch_install(todo, repo, release, no_secure, query_string, use_autoindex, parallel, fanout, timeout)
+
+    print("\n📋 Snapshot restore report:")
     for pkg in pkgs:
-        print(f"📦 Installing from snapshot: {pkg}")
-        install(pkg, repo, release, no_secure, query_string, ntp_sync_flag)
+        if pkg in skipped:
+            print(f"  ⏭ {pkg}: already installed")
+        elif pkg in failed:
+            print(f"  ❌ {pkg}: {failed[pkg]}")
+        else:
+            print(f"  ✅ {pkg}: installed")
+    print(f"Installed: {len(todo) - len(failed)}, skipped: {len(skipped)}, failed: {len(failed)}")
+    if failed:
+        sys.exit(1)
 
+def snapshot_apply(filename, repo=None, release=None, no_secure=False, query_string=None, ntp_sync_flag=False,
+                   use_autoindex=False, parallel=False, fanout=MIRROR_FANOUT, timeout=MIRROR_TIMEOUT, assume_yes=False):
+    if not os.path.exists(filename):
+        print(f"❌ Snapshot file not found: {filename}")
+        return
+    installs, removals, unchanged = snapshot_plan(read_snapshot(filename))
+    print_snapshot_plan(installs, removals, unchanged)
+    if not installs and not removals:
+        print("✅ System already matches the snapshot.")
+        return
+    if not assume_yes and input("Apply these changes? [y/N]: ").strip().lower() != "y":
+        print("⛔ Snapshot apply cancelled.")
+        return
+
+    if ntp_sync_flag:
+        ntp_sync()
+    for name in removals:
+        remove(name, assume_yes=True)
+
+    # Paketler kaydedildikleri repo/release grubundan kurulur; --repo/--release bunu geçersiz kılar
+    groups = {}
+    for entry, _ in installs:
+        key = (repo or entry.get("repo"), release or entry.get("release"))
+        groups.setdefault(key, []).append(entry)
+    failed = {}
+    for (group_repo, group_release), entries in groups.items():
+        expected_hashes = {entry["name"]: entry["hash"] for entry in entries if entry.get("hash")}
+        failed.update(batch_install([entry["name"] for entry in entries], group_repo, group_release, no_secure,
+                                    query_string, use_autoindex, parallel, fanout, timeout, expected_hashes))
+
+    print("\n📋 Snapshot apply report:")
+    for entry, _ in installs:
+        if entry["name"] in failed:
+            print(f"  ❌ {entry['name']}: {failed[entry['name']]}")
+        else:
+            print(f"  ✅ {entry['name']}: installed")
+    for name in removals:
+        print(f"  🗑 {name}: removed")
+    if failed:
+        sys.exit(1)
+
+
+def probe_mirror_speed(mirror, timeout=MIRROR_TIMEOUT):
+    # Önbelleği atlayarak files.json'ı çeker ve gecikme/hız ölçümünü kaydeder
+    url = mirror.rstrip('/') + "/files.json"
+    started = time.monotonic()
+    try:
+        with http_open(url, timeout=timeout) as resp:
+            latency = time.monotonic() - started
+            received = len(resp.read())
+        elapsed = time.monotonic() - started - latency
+    except Exception as e:
+        print(f"❌ Mirror probe failed: {mirror} ({e})")
+        record_mirror_stat(mirror, False)
+        return
+    throughput = None
+    if received >= MIRROR_STATS_MIN_BYTES and elapsed > 0:
+        throughput = received / elapsed
+    record_mirror_stat(mirror, True, latency, throughput)
+
+def mirrors_rank(repo=None, release=None, query_string=None, fanout=MIRROR_FANOUT, timeout=MIRROR_TIMEOUT):
+    from concurrent.futures import ThreadPoolExecutor
+
+    mirrors = read_mirrors(repo, release, query_string)
+    print(f"\U0001F310 Probing {len(mirrors)} mirrors...")
+    with ThreadPoolExecutor(max_workers=max(1, fanout)) as executor:
+        list(executor.map(lambda m: probe_mirror_speed(m, timeout), mirrors))
+
+    stats = load_mirror_stats()
+    print(f"{'#':>3}  {'score':>8}  {'latency':>9}  {'speed':>11}  {'fail':>5}  mirror")
+    for i, mirror in enumerate(rank_mirrors(mirrors), 1):
+        entry = stats.get(mirror.split("?", 1)[0]) or {}
+        latency = f"{entry['latency'] * 1000:.0f} ms" if entry.get("latency") is not None else "-"
+        speed = f"{entry['throughput'] / 1024:.0f} KiB/s" if entry.get("throughput") else "-"
+        failure = f"{entry['failure'] * 100:.0f}%" if entry.get("failure") is not None else "-"
+        print(f"{i:>3}  {mirror_score(entry):>8.3f}  {latency:>9}  {speed:>11}  {failure:>5}  {mirror}")
+
+def print_version():
+    print(f"apkg v{VERSION}")
+    print(f"Author: {AUTHOR} ({ORG})")
 
 def print_help():
     print(f"apkg - archcraft-pkg Alternative realtime crafting header coop reactivable and file-timesnapshot package utility. v{VERSION}")
@@ -430,27 +1772,46 @@ def print_help():
     print("Usage:")
     print("  apkg <command> <package|filename> [options]\n")
     print("Commands:")
-    print("  install <package>           Install a package")
+    print("  install <package>...        Install one or more packages")
     print("  remove <package>            Remove a package")
-    print("  search <package>            Search for a package")
+    print("  sync                        Build the local search index from all repositories")
+    print("  search <query>              Search packages (exact, prefix, substring; --fuzzy for close matches)")
+    print("  owns <path>                 Show which package owns a path")
+    print("  list                        List installed packages")
     print("  --list-keyring              List keys in keyring")
+    print("  mirrors rank                Probe mirrors and show their ranking")
     print("  snapshot save <filename>    Save current snapshot")
-    print("  snapshot load <filename>    Load a snapshot\n")
+    print("  snapshot load <filename>    Load a snapshot (already installed packages are skipped)")
+    print("  snapshot diff <filename>    Show installs/removals needed to match a snapshot")
+    print("  snapshot apply <filename>   Install and remove packages until the system matches a snapshot\n")
     print("Options:")
     print("  --repo=core|community       Specify repository")
     print("  --release=STABLE|UNSTABLE   Specify release channel")
     print("  --no-secure                 Skip PGP verification")
+    print("  --no-stream-verify          Verify the signature after the download instead of during it")
     print("  --query=param=value[...]    Extra query parameters")
     print("  --ntp-sync                  Sync time with NTP server before operation")
-    print("  --autoindex                 Use autoindex mirror feature\n")
-    print(" --remove-cache               Removed cacheing files.\n")
+    print("  --yes                       Do not ask for confirmation")
+    print("  --batch                     Snapshot load: no prompts, parallel downloads, report at the end")
+    print("  --autoindex                 Use autoindex mirror feature")
+    print("  --fuzzy                     Search: always include fuzzy matches")
+    print("  --parallel-mirrors[=N]      Probe N mirrors at once and use the fastest (default: 4)")
+    print("  --mirror-timeout=SECONDS    Per-mirror timeout for parallel mode (default: 10)")
+    print("  --index-ttl=SECONDS         Reuse cached mirror indexes for this long (default: 3600)")
+    print("  --offline                   Use cached mirror indexes only, even if stale\n")
+    print(" --remove-cache               Removed cacheing files.")
+    print("  cache list                  Show cached packages (📌 = installed, never evicted)")
+    print("  cache prune                 Evict least recently used packages over the budget")
+    print("  --cache-budget=MIB          Package cache size budget (default: 2048)")
+    print("  --no-cache                  Always download, ignore cached packages\n")
     print("Other:")
     print("  --help                     Show this help message and exit")
     print("  --version                  Show version information and exit")
 
-if __name__ == "__main__":
+def main():
+    global INDEX_TTL, INDEX_OFFLINE, PKG_CACHE_BUDGET, PKG_CACHE_BYPASS, STREAM_VERIFY
+
     if len(sys.argv) < 2 or sys.argv[1] in ("--help", "-h"):
-        prepare_gpg_env()
         print_help()
         sys.exit(0)
 
@@ -462,12 +1823,19 @@ if __name__ == "__main__":
     cmd = sys.argv[1]
 
     pkgname_or_file = None
+    pkgnames = []
     repo = None
     release = None
     no_secure = False
     query_string = None
     ntp_sync_flag = False
     use_autoindex = False
+    parallel = False
+    assume_yes = False
+    batch = False
+    fuzzy = False
+    fanout = MIRROR_FANOUT
+    timeout = MIRROR_TIMEOUT
 
     # --remove-cache komut olduğundan ayrı işlem yapacağız, bu yüzden argümanlardan almayız
     # Diğer parametreleri argümanlardan alalım
@@ -484,30 +1852,78 @@ if __name__ == "__main__":
             query_string = arg.split("=", 1)[1]
         elif arg == "--ntp-sync":
             ntp_sync_flag = True
+        elif arg == "--yes":
+            assume_yes = True
+        elif arg == "--batch":
+            batch = True
+        elif arg == "--fuzzy":
+            fuzzy = True
+        elif arg == "--parallel-mirrors":
+            parallel = True
+        elif arg.startswith("--parallel-mirrors="):
+            parallel = True
+            fanout = int(arg.split("=", 1)[1])
+        elif arg.startswith("--mirror-timeout="):
+            timeout = float(arg.split("=", 1)[1])
+        elif arg.startswith("--index-ttl="):
+            INDEX_TTL = int(arg.split("=", 1)[1])
+        elif arg == "--offline":
+            INDEX_OFFLINE = True
+        elif arg.startswith("--cache-budget="):
+            PKG_CACHE_BUDGET = int(arg.split("=", 1)[1]) * 1024 ** 2
+        elif arg == "--no-cache":
+            PKG_CACHE_BYPASS = True
+        elif arg == "--no-stream-verify":
+            STREAM_VERIFY = False
         else:
             pkgname_or_file = arg
+            pkgnames.append(arg)
 
     if cmd == "install" and pkgname_or_file:
-        install(pkgname_or_file, repo, release, no_secure, query_string, ntp_sync_flag, use_autoindex)
+        install_many(pkgnames, repo, release, no_secure, query_string, ntp_sync_flag, use_autoindex,
+                     parallel, fanout, timeout, assume_yes)
     elif cmd == "remove" and pkgname_or_file:
         remove(pkgname_or_file)
     elif cmd == "search" and pkgname_or_file:
-        search(pkgname_or_file, repo, release, query_string)
+        search(pkgname_or_file, repo, release, query_string, use_autoindex, fuzzy)
+    elif cmd == "sync":
+        sync(query_string, use_autoindex)
+    elif cmd == "owns" and pkgname_or_file:
+        owns(pkgname_or_file)
+    elif cmd == "list":
+        list_installed()
     elif cmd == "--list-keyring":
         list_keyring()
-    elif cmd == "snapshot" and pkgname_or_file:
-        if pkgname_or_file == "save":
-            if len(sys.argv) < 4:
+    elif cmd == "mirrors" and pkgname_or_file == "rank":
+        mirrors_rank(repo, release, query_string, fanout, timeout)
+    elif cmd == "snapshot" and pkgnames:
+        if pkgnames[0] == "save":
+            if len(pkgnames) < 2:
                 print("❌ Missing snapshot filename for save.")
                 sys.exit(1)
-            snapshot_save(sys.argv[3])
-        elif pkgname_or_file == "load":
-            if len(sys.argv) < 4:
+            snapshot_save(pkgnames[1])
+        elif pkgnames[0] == "load":
+            if len(pkgnames) < 2:
                 print("❌ Missing snapshot filename for load.")
                 sys.exit(1)
-            snapshot_load(sys.argv[3], repo, release, no_secure, query_string, ntp_sync_flag)
+            snapshot_load(pkgnames[1], repo, release, no_secure, query_string, ntp_sync_flag, use_autoindex,
+                          parallel, fanout, timeout, batch)
+        elif pkgnames[0] in ("diff", "apply"):
+            if len(pkgnames) < 2:
+                print(f"❌ Missing snapshot filename for {pkgnames[0]}.")
+                sys.exit(1)
+            if pkgnames[0] == "diff":
+                snapshot_diff(pkgnames[1])
+            else:
+                snapshot_apply(pkgnames[1], repo, release, no_secure, query_string, ntp_sync_flag, use_autoindex,
+                               parallel, fanout, timeout, assume_yes)
         else:
-            print("❌ Invalid snapshot command. Use 'save' or 'load'.")
+            print("❌ Invalid snapshot command. Use 'save', 'load', 'diff' or 'apply'.")
+    elif cmd == "cache" and pkgname_or_file == "list":
+        cache_list()
+    elif cmd == "cache" and pkgname_or_file == "prune":
+        freed = cache_prune()
+        print(f"✅ Freed {freed / 1024 ** 2:.1f} MiB")
     elif cmd == "--remove-cache":
         remove_cache()
         sys.exit(0)
@@ -515,3 +1931,6 @@ if __name__ == "__main__":
         print("❌ Invalid command or missing package name.")
         print_help()
         sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
+import io
 import os
 import sys
 import re
 import shutil
 import argparse
+import hashlib
+import hmac
+import json
 import subprocess
+import threading
+import time
 import requests
 from urllib.parse import urlparse
+import ftplib
 from ftplib import FTP
 
 def resolve_path_env(path, env_vars=None):
@@ -18,31 +25,255 @@ def resolve_path_env(path, env_vars=None):
             path = path.replace(f"{{{k}}}", v)
     return os.path.expandvars(path)
 
+# linux/fs.h: _IOW(0x94, 9, int) — kaynak dosyanın bloklarını hedefle paylaşır (btrfs/XFS)
+FICLONE = 0x40049409
+COPY_CHUNK_SIZE = 1024 * 1024
+
+def copy_reflink(src_fd, dst_fd, size):
+    import fcntl
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+def copy_file_range(src_fd, dst_fd, size):
+    if not hasattr(os, "copy_file_range"):
+        raise OSError("copy_file_range not available")
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(src_fd, dst_fd, size - copied)
+        if n == 0:
+            break
+        copied += n
+    if copied != size:
+        raise OSError(f"copy_file_range stopped at {copied}/{size} bytes")
+
+def copy_sendfile(src_fd, dst_fd, size):
+    copied = 0
+    while copied < size:
+        n = os.sendfile(dst_fd, src_fd, copied, size - copied)
+        if n == 0:
+            break
+        copied += n
+    if copied != size:
+        raise OSError(f"sendfile stopped at {copied}/{size} bytes")
+
+def copy_buffered(src_fd, dst_fd, size):
+    while True:
+        chunk = os.read(src_fd, COPY_CHUNK_SIZE)
+        if not chunk:
+            break
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst_fd, view):]
+
+# Sırayla denenir; ilk başarılı olanın adı raporlanır
+COPY_METHODS = [
+    ("reflink", copy_reflink),
+    ("copy_file_range", copy_file_range),
+    ("sendfile", copy_sendfile),
+    ("buffered", copy_buffered),
+]
+
+def place_file(src_path, dest_path):
+    # "wb" ile açmak kaynağı da keserdi; shutil.copyfile gibi reddet
+    if os.path.exists(dest_path) and os.path.samefile(src_path, dest_path):
+        raise shutil.SameFileError(f"{src_path} and {dest_path} are the same file")
+    with open(src_path, "rb") as src, open(dest_path, "wb") as dst:
+        size = os.fstat(src.fileno()).st_size
+        for name, method in COPY_METHODS:
+            try:
+                method(src.fileno(), dst.fileno(), size)
+                return name
+            except OSError:
+                if name == "buffered":
+                    raise
+                # Yarım kalmış bir denemeden sonra hedefi sıfırla
+                os.lseek(src.fileno(), 0, os.SEEK_SET)
+                os.ftruncate(dst.fileno(), 0)
+                os.lseek(dst.fileno(), 0, os.SEEK_SET)
+
 def fetch_file(src_path, dest_path):
     if not os.path.isfile(src_path):
         raise FileNotFoundError(f"Source file not found: {src_path}")
     os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-    shutil.copyfile(src_path, dest_path)
-    print(f"[FILE] Copied: {src_path} → {dest_path}")
+    method = place_file(src_path, dest_path)
+    print(f"[FILE] Copied ({method}): {src_path} → {dest_path}")
+    return method
 
-def fetch_http(url, dest_path, proxies=None):
-    r = requests.get(url, proxies=proxies)
-    r.raise_for_status()
+# CHECKSUM satırlarından çıkarılan mutlak hedef yolu -> beklenen hash eşlemesi;
+# akış halinde indirilen dosyalar yeniden adlandırılmadan önce buna göre doğrulanır
+CHECKSUMS = {}
+HTTP_CHUNK_SIZE = 1024 * 1024
+HTTP_TIMEOUT = 60
+
+class ChecksumError(Exception):
+    # İndirilen içerik CHECKSUM ile uyuşmuyor; derleme durdurulur
+    pass
+
+def expected_checksum(dest_path):
+    return CHECKSUMS.get(os.path.abspath(dest_path))
+
+def stream_download(url, dest_path, proxies=None, tag="HTTP"):
+    # dest_path.part dosyasına akış halinde yazar, yazarken hash'i hesaplar.
+    # Yarım kalmış .part varsa Range ile kaldığı yerden devam edilir.
     os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-    with open(dest_path, "wb") as f:
-        f.write(r.content)
+    part_path = dest_path + ".part"
+    expected = expected_checksum(dest_path)
+    algorithm, _ = split_checksum(expected) if expected else ("sha256", None)
+    hasher = hashlib.new(algorithm)
+    offset = 0
+    if os.path.exists(part_path):
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HTTP_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+                offset += len(chunk)
+
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with requests.get(url, proxies=proxies, headers=headers, stream=True, timeout=HTTP_TIMEOUT) as r:
+        if r.status_code == 416 and offset:
+            # .part yalnızca toplam boyutu uzak dosyayla aynıysa tamamlanmış sayılır;
+            # daha büyükse ya da başka bir dosyaya aitse silinip baştan indirilir
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            if total != str(offset):
+                print(f"[{tag}] Stale partial file, restarting: {url}")
+                os.remove(part_path)
+                return stream_download(url, dest_path, proxies=proxies, tag=tag)
+        else:
+            r.raise_for_status()
+            if offset and r.status_code != 206:
+                # Sunucu Range desteklemiyor, baştan indir
+                print(f"[{tag}] Resume not supported, restarting: {url}")
+                hasher = hashlib.new(algorithm)
+                offset = 0
+            elif offset:
+                print(f"[{tag}] Resuming at {offset} bytes: {url}")
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in r.iter_content(chunk_size=HTTP_CHUNK_SIZE):
+                    f.write(chunk)
+                    hasher.update(chunk)
+
+    if expected is not None:
+        if not checksum_matches(hasher.hexdigest(), expected):
+            os.remove(part_path)
+            raise ChecksumError(f"Checksum mismatch for {dest_path}")
+        print(f"[OK] Checksum verified: {dest_path}")
+    os.replace(part_path, dest_path)
+    remember_digest(dest_path, algorithm, hasher.hexdigest())
+    return hasher.hexdigest()
+
+def fetch_http(url, dest_path, proxies=None):
+    stream_download(url, dest_path, proxies=proxies)
     print(f"[HTTP] Downloaded: {url} → {dest_path}")
 
+# FTP oturumları (host, port, kullanıcı) başına havuzlanır; aynı sunucudaki
+# setup adımları oturum açmayı yeniden kullanır, farklı sunuculara aktarımlar paralel yürür
+FTP_BLOCK_SIZE = 1024 * 1024
+FTP_TIMEOUT = 60
+FTP_HOST_CONNECTIONS = 2
+ftp_pool = {}
+ftp_pool_lock = threading.Lock()
+
+def ftp_acquire(key):
+    with ftp_pool_lock:
+        pool = ftp_pool.setdefault(key, {"idle": [], "slots": threading.BoundedSemaphore(FTP_HOST_CONNECTIONS)})
+    pool["slots"].acquire()
+    while True:
+        with ftp_pool_lock:
+            ftp = pool["idle"].pop() if pool["idle"] else None
+        if ftp is None:
+            break
+        try:
+            # Boşta kalırken sunucu bağlantıyı kapatmış olabilir
+            ftp.voidcmd("NOOP")
+            return ftp
+        except (OSError, EOFError, ftplib.Error):
+            ftp.close()
+    host, port, user, password = key
+    try:
+        ftp = FTP(timeout=FTP_TIMEOUT)
+        ftp.connect(host, port)
+        ftp.login(user, password)
+    except Exception:
+        pool["slots"].release()
+        raise
+    return ftp
+
+def ftp_release(key, ftp, reuse=True):
+    pool = ftp_pool[key]
+    if reuse:
+        with ftp_pool_lock:
+            pool["idle"].append(ftp)
+    else:
+        ftp.close()
+    pool["slots"].release()
+
+def ftp_close_all():
+    with ftp_pool_lock:
+        for pool in ftp_pool.values():
+            for ftp in pool["idle"]:
+                try:
+                    ftp.quit()
+                except (OSError, EOFError, ftplib.Error):
+                    ftp.close()
+            pool["idle"].clear()
+
+def ftp_retrieve(ftp, ftp_path, part_path, offset, hasher, algorithm):
+    if not offset:
+        hasher = hashlib.new(algorithm)
+    with open(part_path, "ab" if offset else "wb") as f:
+        def write(chunk):
+            f.write(chunk)
+            hasher.update(chunk)
+        ftp.retrbinary(f"RETR {ftp_path}", write, blocksize=FTP_BLOCK_SIZE, rest=offset or None)
+    return hasher
+
 def fetch_ftp(url, dest_path):
     parsed = urlparse(url)
-    ftp_host = parsed.hostname
+    key = (parsed.hostname, parsed.port or 21, parsed.username or "anonymous", parsed.password or "")
     ftp_path = parsed.path
-    ftp = FTP(ftp_host)
-    ftp.login()
     os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-    with open(dest_path, "wb") as f:
-        ftp.retrbinary(f"RETR {ftp_path}", f.write)
-    ftp.quit()
+    part_path = dest_path + ".part"
+    expected = expected_checksum(dest_path)
+    algorithm, _ = split_checksum(expected) if expected else ("sha256", None)
+    hasher = hashlib.new(algorithm)
+    offset = 0
+    if os.path.exists(part_path):
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(FTP_BLOCK_SIZE), b""):
+                hasher.update(chunk)
+                offset += len(chunk)
+
+    ftp = ftp_acquire(key)
+    reuse = False
+    try:
+        ftp.voidcmd("TYPE I")
+        size = None
+        try:
+            size = ftp.size(ftp_path)
+        except ftplib.error_perm:
+            pass
+        if offset and size is not None and offset > size:
+            offset = 0
+        if size is None or offset < size:
+            if offset:
+                print(f"[FTP] Resuming at {offset} bytes: {url}")
+            try:
+                hasher = ftp_retrieve(ftp, ftp_path, part_path, offset, hasher, algorithm)
+            except (ftplib.error_reply, ftplib.error_perm):
+                if not offset:
+                    raise
+                # Sunucu REST desteklemiyor, baştan indir
+                print(f"[FTP] Resume not supported, restarting: {url}")
+                hasher = ftp_retrieve(ftp, ftp_path, part_path, 0, hasher, algorithm)
+        reuse = True
+    finally:
+        ftp_release(key, ftp, reuse=reuse)
+
+    if expected is not None:
+        if not checksum_matches(hasher.hexdigest(), expected):
+            os.remove(part_path)
+            raise ChecksumError(f"Checksum mismatch for {dest_path}")
+        print(f"[OK] Checksum verified: {dest_path}")
+    os.replace(part_path, dest_path)
+    remember_digest(dest_path, algorithm, hasher.hexdigest())
     print(f"[FTP] Downloaded: {url} → {dest_path}")
 
 def fetch_onion(url, dest_path, tor_socks=None):
@@ -57,25 +288,85 @@ def fetch_onion(url, dest_path, tor_socks=None):
             "https": f"socks5h://{tor_socks}"
         }
     full_url = f"http://{hostname}{path}"
-    r = requests.get(full_url, proxies=proxies)
-    r.raise_for_status()
-    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-    with open(dest_path, "wb") as f:
-        f.write(r.content)
+    stream_download(full_url, dest_path, proxies=proxies, tag="ONION")
     print(f"[ONION] Downloaded: {full_url} → {dest_path}")
 
 def fetch_p2p(url, dest_path):
     raise NotImplementedError("P2P protocol not implemented")
 
+# Kabuk çıktısı satır satır canlı yazdırılır; hata raporu için yalnızca son
+# SHELL_TAIL_LINES satır bellekte tutulur
+SHELL_TAIL_LINES = 50
+SHELL_LINE_MAX = 64 * 1024
+shell_session = None
+
+def stream_output(stream, tail, stop=None):
+    # stop verilirse o işarete gelince durur ve işaretin taşıdığı çıkış kodunu döndürür;
+    # işaret, sonu yeni satırla bitmeyen bir çıktının arkasına eklenmiş olabilir
+    while True:
+        line = stream.readline(SHELL_LINE_MAX)
+        if not line:
+            return None
+        returncode = None
+        if stop is not None and stop in line:
+            line, _, status = line.partition(stop)
+            returncode = int(status.strip())
+        if line:
+            tail.append(line)
+            sys.stdout.write(f"[SHELL-OUT] {line}" if line.endswith("\n") else f"[SHELL-OUT] {line}\n")
+            sys.stdout.flush()
+        if returncode is not None:
+            return returncode
+
+class ShellSession:
+    # Tüm BUILD bloğu için tek bir uzun ömürlü /bin/sh; cd ve değişkenler adımlar
+    # arasında korunur. Her adımın sonunda benzersiz bir işaret satırı çıkış kodunu taşır.
+    def __init__(self, shell="/bin/sh"):
+        self.marker = f"__MAKEPKGBUILD_{os.urandom(8).hex()}__ "
+        self.proc = subprocess.Popen([shell], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT, text=True, errors="replace", bufsize=1)
+
+    def run(self, cmd, tail):
+        if self.proc.poll() is not None:
+            raise RuntimeError(f"shell session exited with status {self.proc.returncode}")
+        # Komut stdin'i oturumun betik akışını tüketmesin diye /dev/null'a bağlanır
+        self.proc.stdin.write(f"{{\n{cmd}\n}} </dev/null 2>&1\nprintf '{self.marker}%d\\n' $?\n")
+        self.proc.stdin.flush()
+        returncode = stream_output(self.proc.stdout, tail, stop=self.marker)
+        if returncode is None:
+            raise RuntimeError(f"shell session exited with status {self.proc.wait()}")
+        return returncode
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait()
+
 def execute_shell(cmd):
+    from collections import deque
+
     print(f"[SHELL] Executing: {cmd}")
+    tail = deque(maxlen=SHELL_TAIL_LINES)
+    started = time.monotonic()
     try:
-        result = subprocess.run(cmd, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print(f"[SHELL-OUT]\n{result.stdout}")
-        if result.stderr:
-            print(f"[SHELL-ERR]\n{result.stderr}")
-    except subprocess.CalledProcessError as e:
-        print(f"[SHELL-ERROR] Command failed: {e}\nOutput:\n{e.output}\nError:\n{e.stderr}")
+        if shell_session is not None:
+            returncode = shell_session.run(cmd, tail)
+        else:
+            proc = subprocess.Popen(cmd, shell=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, text=True, errors="replace")
+            with proc:
+                stream_output(proc.stdout, tail)
+                returncode = proc.wait()
+    except (OSError, RuntimeError) as e:
+        print(f"[SHELL-ERROR] Command failed: {e}")
+        return False
+    elapsed = time.monotonic() - started
+    if returncode != 0:
+        print(f"[SHELL-ERROR] Command failed with exit status {returncode} after {elapsed:.2f}s")
+        print(f"[SHELL-ERROR] Last {len(tail)} line(s) of output:\n{''.join(tail)}", end="" if tail else "\n")
+        return False
+    print(f"[SHELL] Done in {elapsed:.2f}s")
+    return True
 
 def resolve_data_url(data_url):
     parsed = urlparse(data_url)
@@ -110,69 +401,606 @@ def fetch_data(uri_info, dest_path, tor_socks=None):
     else:
         raise ValueError(f"Fetch not implemented for type: {typ}")
 
-def run_build(commands, upstreams, tor_socks=None):
+# Birbirinden bağımsız setup adımlarını aynı anda yürüten iş parçacığı sayısı
+BUILD_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+class StepOutput:
+    # Paralel adımların çıktısını iş parçacığı başına tamponlar; kayıt sırası
+    # adımların BUILD içindeki sırasıyla aynı kalsın diye sonradan yazdırılır
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self):
+        self.local.buffer = io.StringIO()
+
+    def release(self):
+        buffer = self.local.buffer
+        self.local.buffer = None
+        return buffer.getvalue()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer or self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+SETUP_PATTERN = re.compile(r'setup\s+-Dm\d+\s+(data_env(\d+):src:(\S+))')
+
+def parse_setup(cmd, upstreams):
+    m = SETUP_PATTERN.match(cmd)
+    if not m:
+        print(f"[SKIP] Unsupported setup command: {cmd}")
+        return None
+    index = int(m.group(2))
+    dest_path = m.group(3)
+    if index-1 >= len(upstreams):
+        print(f"[ERR] data_env{index} not in upstream list")
+        return None
+    data_url = upstreams[index-1]
+    try:
+        data_url_info = resolve_data_url(data_url)
+    except Exception as e:
+        print(f"[ERR] URL parse error: {e}")
+        return None
+    return data_url_info, resolve_path_env(dest_path)
+
+def run_setup(cmd, upstreams, tor_socks=None):
+    step = parse_setup(cmd, upstreams)
+    if step is None:
+        return
+    run_setup_step(cmd, step, tor_socks=tor_socks)
+
+def run_setup_step(cmd, step, tor_socks=None):
+    data_url_info, target_path = step
+    key = setup_step_key(cmd, step)
+    if key is not None and build_cache_restore(key, cmd):
+        return
+    try:
+        fetch_data(data_url_info, target_path, tor_socks=tor_socks)
+    except ChecksumError:
+        raise
+    except Exception as e:
+        print(f"[ERR] Fetch failed: {e}")
+        return
+    if key is not None:
+        build_cache_store(key, [target_path])
+
+def remote_setup_targets(commands, upstreams):
+    # HTTP/onion/FTP setup adımlarının hedefleri; bunların CHECKSUM'ı indirme sırasında doğrulanır
+    targets = set()
     for cmd in commands:
-        print(f"[BUILD] > {cmd}")
-        if cmd.startswith("setup "):
-            m = re.match(r'setup\s+-Dm\d+\s+(data_env(\d+):src:(\S+))', cmd)
-            if not m:
-                print(f"[SKIP] Unsupported setup command: {cmd}")
-                continue
-            full_src_uri = m.group(1)
-            index = int(m.group(2))
-            dest_path = m.group(3)
-            if index-1 >= len(upstreams):
-                print(f"[ERR] data_env{index} not in upstream list")
-                continue
-            data_url = upstreams[index-1]
+        m = SETUP_PATTERN.match(cmd)
+        if not m or not 0 < int(m.group(2)) <= len(upstreams):
+            continue
+        if urlparse(upstreams[int(m.group(2)) - 1]).scheme in ("http", "https", "ftp", "onion"):
+            targets.add(os.path.abspath(resolve_path_env(m.group(3))))
+    return targets
+
+def paths_conflict(a, b):
+    # Aynı yol ya da biri diğerinin üst dizini; setup hedefleri cwd'ye göreli olabilir
+    a = os.path.abspath(a)
+    b = os.path.abspath(b)
+    return a == b or a.startswith(b + os.sep) or b.startswith(a + os.sep)
+
+def setup_dependencies(steps):
+    # Her setup adımı, hedefi çakışan ya da hedefini kaynak olarak okuyan önceki adımları bekler
+    deps = []
+    for i, (_, step) in enumerate(steps):
+        before = []
+        if step is not None:
+            info, target = step
+            for j in range(i):
+                other = steps[j][1]
+                if other is None:
+                    continue
+                other_info, other_target = other
+                if paths_conflict(target, other_target) \
+                        or (info["type"] == "file" and paths_conflict(info["path"], other_target)) \
+                        or (other_info["type"] == "file" and paths_conflict(other_info["path"], target)):
+                    before.append(j)
+        deps.append(before)
+    return deps
+
+def run_setup_group(cmds, upstreams, tor_socks=None, workers=None):
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = workers or BUILD_WORKERS
+    if workers <= 1 or len(cmds) == 1:
+        for cmd in cmds:
+            print(f"[BUILD] > {cmd}")
             try:
-                data_url_info = resolve_data_url(data_url)
-            except Exception as e:
-                print(f"[ERR] URL parse error: {e}")
-                continue
-            target_path = resolve_path_env(dest_path)
+                run_setup(cmd, upstreams, tor_socks=tor_socks)
+            except ChecksumError as e:
+                print(f"[ERR] {e}")
+                sys.exit(1)
+        return
+
+    output = StepOutput(sys.stdout)
+    sys.stdout = output
+    try:
+        steps = []
+        for cmd in cmds:
+            output.capture()
+            step = parse_setup(cmd, upstreams)
+            steps.append((output.release(), step))
+        deps = setup_dependencies(steps)
+
+        def task(i, futures):
+            # Bağımlılıklar daha önce kuyruğa girdiği için bekleme kilitlenmeye yol açmaz
+            for j in deps[i]:
+                futures[j].result()
+            output.capture()
+            error = None
             try:
-                fetch_data(data_url_info, target_path, tor_socks=tor_socks)
-            except Exception as e:
-                print(f"[ERR] Fetch failed: {e}")
+                if steps[i][1] is not None:
+                    run_setup_step(cmds[i], steps[i][1], tor_socks=tor_socks)
+            except ChecksumError as e:
+                error = e
+            finally:
+                log = output.release()
+            return log, error
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i in range(len(cmds)):
+                futures.append(executor.submit(task, i, futures))
+            results = [future.result() for future in futures]
+    finally:
+        sys.stdout = output.stream
+
+    for cmd, (parse_log, _), (log, error) in zip(cmds, steps, results):
+        print(f"[BUILD] > {cmd}")
+        sys.stdout.write(parse_log + log)
+        if error is not None:
+            print(f"[ERR] {error}")
+            sys.exit(1)
+
+# Derleme önbelleği: adım anahtarı MAKEPKGBUILD değişkenleri, komut metni ve girdilerin
+# özetinden türetilir. Çıktılar içerik adresli olarak build_cache/objects altında, adım
+# kayıtları build_cache/steps altında tutulur. Uzak setup adımları CHECKSUM ile, kabuk
+# adımları ise satır sonundaki #CACHE işaretiyle bildirilen girdi/çıktılarıyla önbelleğe
+# alınır; data://file kopyaları zaten yereldir ve önbelleğe alınmaz.
+BUILD_CACHE_DIR = None
+BUILD_CACHE_BASE = ""
+BUILD_CACHE_BUDGET = 1024 * 1024 * 1024
+build_cache_stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+# Kabuk adımlarının son süreleri (komut metni -> saniye); --plan tahmini için saklanır
+build_cache_durations = {}
+build_cache_lock = threading.Lock()
+
+def build_cache_base(variables):
+    data = json.dumps(variables, sort_keys=True).encode()
+    return hashlib.sha256(data).hexdigest()
+
+def step_key(*parts):
+    data = json.dumps([BUILD_CACHE_BASE, *parts]).encode()
+    return hashlib.sha256(data).hexdigest()
+
+def setup_step_key(cmd, step):
+    if BUILD_CACHE_DIR is None:
+        return None
+    data_url_info, target_path = step
+    if data_url_info["type"] == "file":
+        # Önbellekten geri yüklemek kaynağı kopyalamaktan ucuz değil
+        return None
+    # Uzak kaynağın içeriği ancak CHECKSUM ile önceden bilinir; yoksa adım önbelleğe alınmaz
+    source = expected_checksum(target_path)
+    if source is None:
+        return None
+    return step_key("setup", cmd, source, os.path.abspath(target_path))
+
+# Kabuk için yalnızca bir yorum olan işaret, adımın girdi ve çıktılarını bildirir:
+#   pyinstaller --onefile /tmp/a.py --distpath /tmp/dist  #CACHE in=/tmp/a.py out=/tmp/dist/a
+# Birden çok yol virgülle ayrılır; dizinler içlerindeki tüm dosyaları kapsar.
+SHELL_CACHE_PATTERN = re.compile(r'\s#CACHE\s+(.*)$')
+
+def parse_shell_cache(cmd):
+    m = SHELL_CACHE_PATTERN.search(cmd)
+    if not m:
+        return None
+    declared = {"in": [], "out": []}
+    for field in m.group(1).split():
+        name, _, value = field.partition("=")
+        if name not in declared or not value:
+            print(f"[WARN] Ignoring #CACHE field: {field}")
+            continue
+        declared[name] += [os.path.abspath(os.path.expanduser(resolve_path_env(path)))
+                           for path in value.split(",") if path]
+    if not declared["out"]:
+        print(f"[WARN] #CACHE without outputs, step always runs: {cmd}")
+        return None
+    return declared
+
+def declared_files(paths):
+    # Dizinler içlerindeki dosyalara açılır; bildirilen bir yol yoksa None döner
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+        elif os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names))
         else:
-            execute_shell(cmd)
+            return None
+    return files
+
+def shell_step_key(cmd, declared):
+    if BUILD_CACHE_DIR is None or declared is None:
+        return None
+    inputs = declared_files(declared["in"])
+    if inputs is None:
+        return None
+    digests = [(path, file_digest(path, "sha256")) for path in inputs]
+    return step_key("shell", cmd, digests, declared["out"])
+
+def build_cache_paths(key):
+    return os.path.join(BUILD_CACHE_DIR, "steps", key + ".json"), os.path.join(BUILD_CACHE_DIR, "objects")
+
+def build_cache_restore(key, cmd):
+    manifest_path, objects_dir = build_cache_paths(key)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        for path, entry in manifest["outputs"].items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".cache-tmp"
+            place_file(os.path.join(objects_dir, entry["digest"]), tmp_path)
+            os.chmod(tmp_path, entry["mode"])
+            os.replace(tmp_path, path)
+            remember_digest(path, "sha256", entry["digest"])
+    except (OSError, ValueError, KeyError):
+        with build_cache_lock:
+            build_cache_stats["misses"] += 1
+        return False
+    # LRU için son kullanım zamanı
+    os.utime(manifest_path)
+    with build_cache_lock:
+        build_cache_stats["hits"] += 1
+    print(f"[CACHE] Hit, restored {len(manifest['outputs'])} file(s): {cmd}")
+    return True
+
+def build_cache_store(key, outputs):
+    manifest_path, objects_dir = build_cache_paths(key)
+    os.makedirs(objects_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    entries = {}
+    for path in outputs:
+        if not os.path.isfile(path):
+            continue
+        digest = file_digest(path, "sha256")
+        object_path = os.path.join(objects_dir, digest)
+        if not os.path.exists(object_path):
+            tmp_path = f"{object_path}.{threading.get_ident()}.tmp"
+            place_file(path, tmp_path)
+            os.replace(tmp_path, object_path)
+        entries[os.path.abspath(path)] = {"digest": digest, "mode": os.stat(path).st_mode & 0o7777}
+    tmp_path = f"{manifest_path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"outputs": entries}, f)
+    os.replace(tmp_path, manifest_path)
+    with build_cache_lock:
+        build_cache_stats["stored"] += 1
+
+def run_shell_step(cmd):
+    declared = parse_shell_cache(cmd)
+    # Oturum kipinde atlanan bir adım cd/değişken durumunu değiştirmez, göreli yollar da
+    # oturumun dizinine göredir; bu yüzden --shell-session ile kabuk adımları önbelleğe alınmaz
+    key = shell_step_key(cmd, declared) if shell_session is None else None
+    if key is not None and build_cache_restore(key, cmd):
+        return True
+    started = time.monotonic()
+    ok = execute_shell(cmd)
+    if ok and BUILD_CACHE_DIR is not None:
+        build_cache_durations[cmd] = round(time.monotonic() - started, 3)
+        if key is not None:
+            outputs = declared_files(declared["out"])
+            if outputs is None:
+                print(f"[WARN] Declared output missing, step not cached: {cmd}")
+            else:
+                build_cache_store(key, outputs)
+    return ok
+
+def build_cache_prune(budget=None):
+    # Bütçe aşılırsa en uzun süredir kullanılmayan adım kayıtları silinir,
+    # ardından hiçbir kaydın başvurmadığı nesneler temizlenir
+    budget = BUILD_CACHE_BUDGET if budget is None else budget
+    steps_dir, objects_dir = os.path.join(BUILD_CACHE_DIR, "steps"), os.path.join(BUILD_CACHE_DIR, "objects")
+    if not os.path.isdir(objects_dir):
+        return
+    manifests = []
+    for name in os.listdir(steps_dir):
+        path = os.path.join(steps_dir, name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                digests = {entry["digest"] for entry in json.load(f)["outputs"].values()}
+            manifests.append((os.stat(path).st_mtime, path, digests))
+        except (OSError, ValueError, KeyError):
+            os.remove(path)
+    manifests.sort()
+    sizes = {name: os.stat(os.path.join(objects_dir, name)).st_size for name in os.listdir(objects_dir)}
+
+    def referenced():
+        return set().union(*(digests for _, _, digests in manifests))
+
+    live = referenced()
+    while manifests and sum(sizes[d] for d in live if d in sizes) > budget:
+        _, path, _ = manifests.pop(0)
+        os.remove(path)
+        build_cache_stats["evicted"] += 1
+        live = referenced()
+    for name in sizes:
+        if name not in live:
+            os.remove(os.path.join(objects_dir, name))
+
+def load_step_durations():
+    try:
+        with open(os.path.join(BUILD_CACHE_DIR, "durations.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def build_cache_report():
+    stats_path = os.path.join(BUILD_CACHE_DIR, "stats.json")
+    totals = {}
+    try:
+        with open(stats_path, encoding="utf-8") as f:
+            totals = json.load(f)
+    except (OSError, ValueError):
+        pass
+    for k, v in build_cache_stats.items():
+        totals[k] = totals.get(k, 0) + v
+    os.makedirs(BUILD_CACHE_DIR, exist_ok=True)
+    with open(stats_path, "w", encoding="utf-8") as f:
+        json.dump(totals, f)
+    durations = load_step_durations()
+    durations.update(build_cache_durations)
+    with open(os.path.join(BUILD_CACHE_DIR, "durations.json"), "w", encoding="utf-8") as f:
+        json.dump(durations, f)
+    lookups = build_cache_stats["hits"] + build_cache_stats["misses"]
+    rate = 100 * build_cache_stats["hits"] / lookups if lookups else 0
+    print(f"[CACHE] hits={build_cache_stats['hits']} misses={build_cache_stats['misses']} "
+          f"stored={build_cache_stats['stored']} evicted={build_cache_stats['evicted']} ({rate:.0f}% hit rate)")
+
+def run_build(commands, upstreams, tor_socks=None, workers=None):
+    # Kabuk satırları engel (barrier) görevi görür; aradaki ardışık setup satırları
+    # bir grup olarak bağımlılık sırasına göre paralel yürütülür
+    group = []
+    for cmd in commands:
+        if cmd.startswith("setup "):
+            group.append(cmd)
+            continue
+        if group:
+            run_setup_group(group, upstreams, tor_socks=tor_socks, workers=workers)
+            group = []
+        print(f"[BUILD] > {cmd}")
+        run_shell_step(cmd)
+    if group:
+        run_setup_group(group, upstreams, tor_socks=tor_socks, workers=workers)
+
+# GITCHECK depoları URL'ye göre anahtarlanan paylaşılan bare mirror'larda tutulur;
+# derleme dizinine yalnızca istenen ref sığ (depth 1) olarak getirilir
+GIT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "makepkgbuild", "git")
+GIT_FETCH_DEPTH = 1
+
+def git(*args, cwd=None):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, text=True).stdout.strip()
+
+def git_mirror_path(repo_url):
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", repo_url.rstrip("/").rsplit("/", 1)[-1]) or "repo"
+    key = hashlib.sha256(repo_url.encode()).hexdigest()[:16]
+    return os.path.join(GIT_CACHE_DIR, f"{key}-{name}")
+
+def git_has_ref(mirror, git_ref):
+    try:
+        git("rev-parse", "--verify", "--quiet", f"{git_ref}^{{commit}}", cwd=mirror)
+        return True
+    except subprocess.CalledProcessError:
+        return False
+
+def update_git_mirror(repo_url, git_ref):
+    # Çağıran kilidi tutar
+    mirror = git_mirror_path(repo_url)
+    if not os.path.isdir(mirror):
+        os.makedirs(GIT_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{mirror}.{os.getpid()}.tmp"
+        print(f"[GIT] Creating mirror: {repo_url}")
+        git("clone", "--mirror", "--quiet", repo_url, tmp_path)
+        # Sığ istemcilerin etiket/dal dışındaki commit'leri de isteyebilmesi için
+        git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=tmp_path)
+        os.rename(tmp_path, mirror)
+    elif re.fullmatch(r"[0-9a-f]{40}", git_ref) and git_has_ref(mirror, git_ref):
+        # Sabit bir commit zaten mirror'da, ağa çıkmaya gerek yok
+        print(f"[GIT] Mirror already has {git_ref}")
+    else:
+        print(f"[GIT] Fetching updates into mirror: {repo_url}")
+        git("fetch", "--prune", "--quiet", "origin", cwd=mirror)
+    return mirror
 
 def process_gitcheck(git_url_line):
+    import fcntl
+
     if "@" in git_url_line:
         repo_url, git_ref = git_url_line.split("@", 1)
     else:
         repo_url, git_ref = git_url_line, "HEAD"
 
     dest_dir = os.path.join(os.getcwd(), "gitrepo")
-    if not os.path.exists(dest_dir):
-        subprocess.run(["git", "clone", repo_url, dest_dir])
-    subprocess.run(["git", "-C", dest_dir, "checkout", git_ref])
+    os.makedirs(GIT_CACHE_DIR, exist_ok=True)
+    lock_path = git_mirror_path(repo_url) + ".lock"
+    try:
+        with open(lock_path, "w") as lock:
+            # Mirror güncellenirken özel kilit; eşzamanlı derlemeler sırayla bekler,
+            # ardından kilit paylaşımlıya indirilir ve checkout'lar birlikte okuyabilir
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            mirror = update_git_mirror(repo_url, git_ref)
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            # Kısaltılmış commit id'leri uzaktan fetch ile çözülemez; ref mirror'da tam SHA'ya çevrilir
+            commit = git("rev-parse", "--verify", f"{git_ref}^{{commit}}", cwd=mirror)
+
+            if not os.path.isdir(os.path.join(dest_dir, ".git")):
+                git("init", "--quiet", dest_dir)
+                git("remote", "add", "origin", repo_url, cwd=dest_dir)
+            git("fetch", "--quiet", f"--depth={GIT_FETCH_DEPTH}", f"file://{mirror}", commit, cwd=dest_dir)
+            git("checkout", "--quiet", "--force", "FETCH_HEAD", cwd=dest_dir)
+    except subprocess.CalledProcessError as e:
+        print(f"[ERR] GITCHECK failed: {' '.join(e.cmd)}\n{e.stderr}")
+        sys.exit(1)
     print(f"[GIT] Checked out {git_ref} from {repo_url}")
 
-def verify_checksum(file_path, expected_hash):
-    sha256 = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            sha256.update(chunk)
-    actual_hash = sha256.hexdigest()
-    return actual_hash.startswith(expected_hash[:8])
+# Hash uzunluğundan algoritma tahmini; "sha512:<hex>" gibi açık önek de kabul edilir
+CHECKSUM_ALGORITHMS = {32: "md5", 40: "sha1", 56: "sha224", 64: "sha256", 96: "sha384", 128: "sha512"}
+CHECKSUM_BUFFER_SIZE = 8 * 1024 * 1024
+CHECKSUM_WORKERS = os.cpu_count() or 1
+
+# Değişmemiş dosyalar yeniden hashlenmesin diye (aygıt, inode, boyut, mtime) anahtarlı özet önbelleği
+DIGEST_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "makepkgbuild", "digests.json")
+DIGEST_CACHE_MAX = 10000
+digest_cache = None
+digest_cache_lock = threading.Lock()
 
-def process_checksum(checksums):
+def split_checksum(expected_hash):
+    expected_hash = expected_hash.strip().lower()
+    if ":" in expected_hash:
+        algorithm, digest = expected_hash.split(":", 1)
+    else:
+        digest = expected_hash
+        algorithm = CHECKSUM_ALGORITHMS.get(len(digest))
+    if algorithm not in hashlib.algorithms_available:
+        raise ValueError(f"Unknown checksum algorithm for: {expected_hash}")
+    return algorithm, digest
+
+def checksum_matches(actual_hash, expected_hash):
+    _, digest = split_checksum(expected_hash)
+    return hmac.compare_digest(actual_hash.lower(), digest)
+
+def parse_checksums(checksums):
+    entries = []
     for checksum in checksums:
-        parts = checksum.strip().split("...")
-        if len(parts) != 2:
+        checksum = checksum.strip()
+        if "..." in checksum:
+            parts = checksum.split("...")
+        else:
+            # README biçimi: dosya:hash
+            parts = checksum.rsplit(":", 1)[::-1]
+        if len(parts) != 2 or not parts[0] or not parts[1]:
             print(f"[WARN] Skipping invalid checksum format: {checksum}")
             continue
-        expected_hash, filename = parts
+        entries.append((parts[0], parts[1]))
+    return entries
+
+def digest_key(st, algorithm):
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}:{algorithm}"
+
+def load_digest_cache():
+    global digest_cache
+    with digest_cache_lock:
+        if digest_cache is None:
+            try:
+                with open(DIGEST_CACHE, encoding="utf-8") as f:
+                    digest_cache = json.load(f)
+            except (OSError, ValueError):
+                digest_cache = {}
+        return digest_cache
+
+def save_digest_cache():
+    if digest_cache is None:
+        return
+    with digest_cache_lock:
+        # En eski kayıtlar önce atılır (dict ekleme sırasını korur)
+        while len(digest_cache) > DIGEST_CACHE_MAX:
+            del digest_cache[next(iter(digest_cache))]
+        try:
+            os.makedirs(os.path.dirname(DIGEST_CACHE), exist_ok=True)
+            tmp_path = DIGEST_CACHE + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(digest_cache, f)
+            os.replace(tmp_path, DIGEST_CACHE)
+        except OSError as e:
+            print(f"[WARN] Could not save digest cache: {e}")
+
+def remember_digest(file_path, algorithm, digest):
+    cache = load_digest_cache()
+    key = digest_key(os.stat(file_path), algorithm)
+    with digest_cache_lock:
+        cache.pop(key, None)
+        cache[key] = digest
+
+def file_digest(file_path, algorithm):
+    import mmap
+
+    cache = load_digest_cache()
+    st = os.stat(file_path)
+    key = digest_key(st, algorithm)
+    with digest_cache_lock:
+        digest = cache.get(key)
+    if digest is not None:
+        return digest
+
+    hasher = hashlib.new(algorithm)
+    with open(file_path, "rb") as f:
+        if st.st_size > 0:
+            # mmap ile hash, büyük bloklar halinde ve GIL bırakılarak hesaplanır
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, memoryview(m) as view:
+                    for offset in range(0, len(view), CHECKSUM_BUFFER_SIZE):
+                        hasher.update(view[offset:offset + CHECKSUM_BUFFER_SIZE])
+            except (OSError, ValueError):
+                hasher = hashlib.new(algorithm)
+                f.seek(0)
+                for chunk in iter(lambda: f.read(CHECKSUM_BUFFER_SIZE), b""):
+                    hasher.update(chunk)
+    digest = hasher.hexdigest()
+    remember_digest(file_path, algorithm, digest)
+    return digest
+
+def verify_checksum(file_path, expected_hash):
+    algorithm, _ = split_checksum(expected_hash)
+    actual_hash = file_digest(file_path, algorithm)
+    return checksum_matches(actual_hash, expected_hash)
+
+def process_checksum(entries, remote_targets=(), after_build=False, workers=None):
+    # Var olan dosyaları doğrular, henüz olmayanları döndürür. Uzak setup adımlarının
+    # hedefleri indirme sırasında, diğerleri (data://file, kabuk çıktıları, önbellekten
+    # geri yüklenenler) derleme bittikten sonra after_build=True ile yeniden doğrulanır.
+    from concurrent.futures import ThreadPoolExecutor
+
+    checks = []
+    deferred = []
+    for expected_hash, filename in entries:
         path = resolve_path_env(f"./{filename}")
         if not os.path.exists(path):
-            print(f"[ERR] Checksum file not found: {filename}")
+            if after_build:
+                print(f"[ERR] Checksum file not found: {filename}")
+                continue
+            if os.path.abspath(path) in remote_targets:
+                print(f"[INFO] Checksum deferred until download: {filename}")
+            else:
+                print(f"[INFO] Checksum deferred until the build finishes: {filename}")
+            deferred.append((expected_hash, filename))
             continue
-        if not verify_checksum(path, expected_hash):
-            print(f"[ERR] Checksum mismatch for {filename}")
-            sys.exit(1)
-        print(f"[OK] Checksum verified: {filename}")
+        checks.append((expected_hash, filename, path))
+
+    # Dosyalar paralel hashlenir, sonuçlar CHECKSUM sırasıyla raporlanır
+    with ThreadPoolExecutor(max_workers=workers or CHECKSUM_WORKERS) as executor:
+        futures = [executor.submit(verify_checksum, path, expected_hash) for expected_hash, _, path in checks]
+        try:
+            for (expected_hash, filename, _), future in zip(checks, futures):
+                try:
+                    ok = future.result()
+                except ValueError as e:
+                    print(f"[ERR] {e}")
+                    sys.exit(1)
+                if not ok:
+                    print(f"[ERR] Checksum mismatch for {filename}")
+                    sys.exit(1)
+                print(f"[OK] Checksum verified: {filename}")
+        finally:
+            save_digest_cache()
+    return deferred
 
 def parse_makepkgbuild(filepath):
     data = {}
@@ -208,11 +1036,210 @@ def parse_makepkgbuild(filepath):
     data["__PARAGMAS__"] = paragmas
     return data, build_commands
 
+# --plan: hiçbir şey indirmeden/çalıştırmadan derlemenin maliyetini JSON olarak çıkarır
+PLAN_BANDWIDTH = 10 * 1024 * 1024
+PLAN_PROBE_TIMEOUT = 10
+
+def probe_upstream(data_url_info, tor_socks=None):
+    # Boyut ve gecikme için HEAD / FTP SIZE / stat
+    typ = data_url_info["type"]
+    probe = {"type": typ, "size": None, "reachable": False, "latency_ms": None, "via": "direct"}
+    started = time.monotonic()
+    try:
+        if typ == "file":
+            probe["location"] = data_url_info["path"]
+            probe["size"] = os.stat(data_url_info["path"]).st_size
+            probe["via"] = "local"
+        elif typ in ("http", "onion"):
+            url = data_url_info["url"]
+            proxies = None
+            if typ == "onion":
+                parsed = urlparse(url)
+                url = f"http://{parsed.hostname}{parsed.path or '/'}"
+                if tor_socks:
+                    proxies = {"http": f"socks5h://{tor_socks}", "https": f"socks5h://{tor_socks}"}
+                    probe["via"] = f"tor {tor_socks}"
+            probe["location"] = urlparse(url).netloc.rsplit("@", 1)[-1]
+            r = requests.head(url, proxies=proxies, allow_redirects=True, timeout=PLAN_PROBE_TIMEOUT)
+            r.raise_for_status()
+            if r.headers.get("Content-Length"):
+                probe["size"] = int(r.headers["Content-Length"])
+            probe["resumable"] = r.headers.get("Accept-Ranges") == "bytes"
+        elif typ == "ftp":
+            parsed = urlparse(data_url_info["url"])
+            key = (parsed.hostname, parsed.port or 21, parsed.username or "anonymous", parsed.password or "")
+            probe["location"] = parsed.netloc.rsplit("@", 1)[-1]
+            ftp = ftp_acquire(key)
+            try:
+                ftp.voidcmd("TYPE I")
+                probe["size"] = ftp.size(parsed.path)
+            finally:
+                ftp_release(key, ftp)
+        else:
+            probe["error"] = f"cannot probe {typ} upstreams"
+            return probe
+        probe["reachable"] = True
+    except Exception as e:
+        probe["error"] = str(e)
+    probe["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return probe
+
+def probe_gitcheck(git_url_line):
+    repo_url, _, git_ref = git_url_line.partition("@")
+    git_ref = git_ref or "HEAD"
+    mirror = git_mirror_path(repo_url)
+    plan = {"url": repo_url, "ref": git_ref, "mirror": mirror, "mirror_cached": os.path.isdir(mirror)}
+    try:
+        if re.fullmatch(r"[0-9a-f]{40}", git_ref):
+            plan["commit"] = git_ref
+        else:
+            out = subprocess.run(["git", "ls-remote", repo_url, git_ref], check=True, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, text=True, timeout=PLAN_PROBE_TIMEOUT).stdout
+            plan["commit"] = out.split()[0] if out else None
+        plan["satisfied"] = bool(plan["mirror_cached"] and plan["commit"] and git_has_ref(mirror, plan["commit"]))
+    except (OSError, subprocess.SubprocessError, IndexError) as e:
+        plan["error"] = str(e)
+        plan["satisfied"] = False
+    return plan
+
+def build_plan(variables, commands, upstreams, tor_socks=None, workers=None, bandwidth=None, session=False):
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = workers or BUILD_WORKERS
+    bandwidth = bandwidth or PLAN_BANDWIDTH
+    stdout = sys.stdout
+    # Ayrıştırma uyarıları JSON çıktısını bozmasın
+    sys.stdout = sys.stderr
+    try:
+        parsed = [(cmd, parse_setup(cmd, upstreams) if cmd.startswith("setup ") else parse_shell_cache(cmd))
+                  for cmd in commands]
+    finally:
+        sys.stdout = stdout
+
+    # Tüm upstream'ler ve GITCHECK aynı anda yoklanır
+    infos = {}
+    for url in upstreams:
+        try:
+            infos[url] = resolve_data_url(url)
+        except ValueError:
+            infos[url] = None
+    with ThreadPoolExecutor(max_workers=max(1, len(infos) + 1)) as executor:
+        probes = {url: executor.submit(probe_upstream, info, tor_socks) for url, info in infos.items() if info}
+        gitcheck = executor.submit(probe_gitcheck, variables["GITCHECK"]) if "GITCHECK" in variables else None
+        probes = {url: future.result() for url, future in probes.items()}
+        gitcheck = gitcheck.result() if gitcheck else None
+
+    durations = load_step_durations() if BUILD_CACHE_DIR else {}
+    steps = []
+    total_bytes = 0
+    wall = 0.0
+    group = []
+
+    def close_group():
+        # Bir setup grubu en yavaş adımı ya da iş parçacıklarına bölünmüş toplamı kadar sürer
+        nonlocal wall, group
+        if group:
+            wall += max(max(group), sum(group) / workers)
+            group = []
+
+    for i, (cmd, step) in enumerate(parsed, 1):
+        entry = {"index": i, "command": cmd, "kind": "setup" if cmd.startswith("setup ") else "shell"}
+        if entry["kind"] == "shell":
+            close_group()
+            duration = durations.get(cmd)
+            key = shell_step_key(cmd, step) if not session else None
+            cached = key is not None and os.path.exists(build_cache_paths(key)[0])
+            if cached:
+                reason = "build cache hit"
+            elif session:
+                reason = "shell steps always run with --shell-session"
+            elif step is None:
+                reason = "shell steps without #CACHE outputs always run"
+            else:
+                reason = "declared inputs changed or not built yet"
+            entry.update({"satisfied": cached, "reason": reason, "last_duration": duration})
+            if not cached:
+                wall += duration or 0
+            steps.append(entry)
+            continue
+        if step is None:
+            entry.update({"satisfied": False, "error": "unsupported or unresolved setup command"})
+            steps.append(entry)
+            continue
+
+        data_url_info, target_path = step
+        url = data_url_info["url"].strip() if "url" in data_url_info else f"data://file{data_url_info['path']}"
+        probe = probes.get(next((u for u, info in infos.items() if info == data_url_info), None), {})
+        key = setup_step_key(cmd, step)
+        cached = key is not None and os.path.exists(build_cache_paths(key)[0])
+        expected = expected_checksum(target_path)
+        try:
+            target_ok = bool(expected and os.path.isfile(target_path) and verify_checksum(target_path, expected))
+        except ValueError:
+            target_ok = False
+        size = probe.get("size")
+        to_transfer = 0
+        if not cached and data_url_info["type"] != "file":
+            part_path = target_path + ".part"
+            done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            to_transfer = max(0, size - done) if size is not None else None
+        entry.update({
+            "upstream": url,
+            "target": target_path,
+            "mirror": probe.get("location"),
+            "via": probe.get("via"),
+            "reachable": probe.get("reachable"),
+            "size": size,
+            "bytes_to_transfer": to_transfer,
+            "satisfied": cached,
+            "reason": "build cache hit" if cached else None,
+            "target_matches_checksum": target_ok if expected else None,
+        })
+        if probe.get("error"):
+            entry["error"] = probe["error"]
+        total_bytes += to_transfer or 0
+        seconds = 0.0
+        if not cached:
+            seconds = (probe.get("latency_ms") or 0) / 1000
+            # Yerel kopyalar ağ bant genişliğini kullanmaz; 0 bayt "tamamı zaten indirilmiş" demektir
+            if data_url_info["type"] != "file":
+                remaining = size if to_transfer is None else to_transfer
+                seconds += (remaining or 0) / bandwidth
+        group.append(seconds)
+        steps.append(entry)
+    close_group()
+
+    return {
+        "makepkgbuild": os.path.join(os.getcwd(), "MAKEPKGBUILD"),
+        "build_cache": BUILD_CACHE_DIR,
+        "gitcheck": gitcheck,
+        "steps": steps,
+        "satisfied_steps": [step["index"] for step in steps if step["satisfied"]],
+        "unknown_transfer_sizes": sum(1 for step in steps if step["kind"] == "setup" and step.get("bytes_to_transfer", 0) is None),
+        "bytes_to_transfer": total_bytes,
+        "mirrors": sorted({step["mirror"] for step in steps if step.get("mirror") and step.get("via") != "local"}),
+        "workers": workers,
+        "assumed_bandwidth": bandwidth,
+        "estimated_wall_seconds": round(wall, 2),
+    }
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-sc", "--clean-cache", action="store_true")
     parser.add_argument("--tor-socks", type=str, default=None,
                         help="Tor SOCKS5 proxy address (e.g. 127.0.0.1:9050)")
+    parser.add_argument("--shell-session", action="store_true",
+                        help="Run all BUILD shell lines in one persistent shell (cd and variables carry over)")
+    parser.add_argument("--no-build-cache", action="store_true",
+                        help="Run every BUILD step without consulting build_cache")
+    parser.add_argument("--cache-size", type=int, default=BUILD_CACHE_BUDGET // (1024 * 1024),
+                        help="build_cache size budget in MiB")
+    parser.add_argument("--plan", action="store_true",
+                        help="Print a JSON preflight plan (sizes, cache hits, estimated time) and exit")
+    parser.add_argument("--plan-bandwidth", type=float, default=PLAN_BANDWIDTH / (1024 * 1024),
+                        help="Assumed download bandwidth in MiB/s for --plan estimates")
+    parser.add_argument("-j", "--jobs", type=int, default=BUILD_WORKERS,
+                        help="Number of setup steps fetched in parallel (1 = sequential)")
     args = parser.parse_args()
 
     cwd = os.getcwd()
@@ -234,17 +1261,10 @@ def main():
                 print(f"[SKIP] This package is not intended for your OS: {current_os}")
                 sys.exit(0)
 
-    # GITCHECK işle
-    if "GITCHECK" in variables:
+    # GITCHECK işle (--plan yalnızca yoklar)
+    if "GITCHECK" in variables and not args.plan:
         process_gitcheck(variables["GITCHECK"])
 
-    # CHECKSUM işle
-    if "CHECKSUM" in variables:
-        checksums = variables["CHECKSUM"]
-        if isinstance(checksums, str):
-            checksums = [v.strip() for v in checksums.strip('()').split(',')]
-        process_checksum(checksums)
-
     # Upstream verisi zorunlu
     if "upstream" not in variables:
         print("[ERR] upstream missing")
@@ -268,14 +1288,55 @@ def main():
         resolved_url = resolved_url.replace("{HOME_ENV}", env_vars.get("HOME", os.path.expanduser("~")))
         resolved_upstreams.append(resolved_url)
 
+    # CHECKSUM işle (uzak setup hedeflerini bilmek için upstream'ler çözüldükten sonra)
+    deferred_checksums = []
+    if "CHECKSUM" in variables:
+        checksums = variables["CHECKSUM"]
+        if isinstance(checksums, str):
+            checksums = [v.strip() for v in checksums.strip('()').split(',')]
+        entries = parse_checksums(checksums)
+        for expected_hash, filename in entries:
+            CHECKSUMS[os.path.abspath(resolve_path_env(f"./{filename}"))] = expected_hash
+        if not args.plan:
+            deferred_checksums = process_checksum(entries, remote_setup_targets(build_commands, resolved_upstreams))
+
+    # Cache temizleme opsiyonu: derlemeden önce, temiz bir derleme için
+    cache_dir = os.path.join(cwd, "build_cache")
+    if args.clean_cache and not args.plan and os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+        print(f"[INFO] Cache cleaned: {cache_dir}")
+
+    global BUILD_CACHE_DIR, BUILD_CACHE_BASE, shell_session
+    if not args.no_build_cache:
+        BUILD_CACHE_DIR = cache_dir
+        BUILD_CACHE_BASE = build_cache_base(variables)
+
+    if args.plan:
+        try:
+            plan = build_plan(variables, build_commands, resolved_upstreams, tor_socks=args.tor_socks,
+                              workers=args.jobs, bandwidth=args.plan_bandwidth * 1024 * 1024,
+                              session=args.shell_session)
+        finally:
+            ftp_close_all()
+            save_digest_cache()
+        print(json.dumps(plan, indent=2))
+        return
+
     # Derleme işlemi başlat
-    run_build(build_commands, resolved_upstreams, tor_socks=args.tor_socks)
-
-    # Cache temizleme opsiyonu
-    if args.clean_cache:
-        cache_dir = os.path.join(cwd, "build_cache")
-        if os.path.isdir(cache_dir):
-            shutil.rmtree(cache_dir)
-            print(f"[INFO] Cache cleaned: {cache_dir}")
+    if args.shell_session:
+        shell_session = ShellSession()
+    try:
+        run_build(build_commands, resolved_upstreams, tor_socks=args.tor_socks, workers=args.jobs)
+    finally:
+        if shell_session is not None:
+            shell_session.close()
+        ftp_close_all()
+    if deferred_checksums:
+        process_checksum(deferred_checksums, after_build=True)
+    save_digest_cache()
+
+    if BUILD_CACHE_DIR is not None:
+        build_cache_prune(args.cache_size * 1024 * 1024)
+        build_cache_report()
 if __name__ == "__main__":
     main()
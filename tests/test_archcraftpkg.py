@@ -0,0 +1,639 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+import archcraftpkg
+
+SRC = str(Path(__file__).resolve().parent.parent / "src")
+
+
+class MirrorStandIn:
+    # files.json, Range ve ETag destekleyen küçük HTTP mirror'ı
+    def __init__(self, files=None, index=True):
+        self.files = dict(files or {})
+        self.index = index
+        self.requests = []
+        # True ise 206 yanıtları istenen konumu yok sayıp baştan gönderilir
+        self.misplaced_ranges = False
+        # Sıradaki bu kadar istek 503 ile yanıtlanır
+        self.failures = 0
+        mirror = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(head=True)
+
+            def do_GET(self):
+                self.respond(head=False)
+
+            def respond(self, head):
+                mirror.requests.append((self.command, self.path, dict(self.headers), self.client_address[1]))
+                name = self.path.lstrip("/")
+                if mirror.failures:
+                    mirror.failures -= 1
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if name == "files.json" and mirror.index:
+                    body = json.dumps([{"name": n, "type": "file"} for n in sorted(mirror.files)]).encode()
+                    etag = f'"{len(mirror.files)}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                elif name in mirror.files:
+                    body = mirror.files[name]
+                    etag = f'"{hash(body) & 0xffffffff:x}"'
+                else:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                start = 0
+                status = 200
+                byte_range = self.headers.get("Range")
+                if_range = self.headers.get("If-Range")
+                if byte_range and (if_range is None or if_range == etag):
+                    start = int(byte_range.split("=")[1].split("-")[0])
+                    if start >= len(body):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(body)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    status = 206
+                    if mirror.misplaced_ranges:
+                        start = 0
+                self.send_response(status)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body) - start))
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body[start:])
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def fetched(self, name):
+        return [r for r in self.requests if r[0] == "GET" and r[1] == "/" + name]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def mirror():
+    servers = []
+
+    def start(files=None, index=True):
+        server = MirrorStandIn(files, index)
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.close()
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    monkeypatch.setattr(archcraftpkg, "CACHE_DIR", cache)
+    monkeypatch.setattr(archcraftpkg, "INDEX_CACHE_DIR", cache / "index")
+    monkeypatch.setattr(archcraftpkg, "MIRROR_STATS", tmp_path / "mirrorstats.json")
+    return cache
+
+@pytest.fixture
+def blackhole():
+    # Bağlantıyı kabul eden ama hiç yanıt vermeyen mirror
+    sock = socket.create_server(("127.0.0.1", 0))
+    yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    sock.close()
+
+
+# race_mirrors
+
+def test_race_mirrors_yields_mirrors_with_the_package(mirror, cache_dir):
+    has = mirror({"foo.pkg.tar.zst": b"x"})
+    lacks = mirror({"bar.pkg.tar.zst": b"x"})
+    assert list(archcraftpkg.race_mirrors([lacks.url, has.url], "foo.pkg.tar.zst", timeout=5)) == [has.url]
+
+def test_race_mirrors_does_not_wait_for_losing_probes(mirror, blackhole, tmp_path):
+    fast = mirror({"foo.pkg.tar.zst": b"x"})
+    script = (
+        "import pathlib, archcraftpkg as a\n"
+        f"a.CACHE_DIR = pathlib.Path({str(tmp_path)!r})\n"
+        "a.INDEX_CACHE_DIR = a.CACHE_DIR / 'index'\n"
+        f"race = a.race_mirrors([{blackhole!r}, {fast.url!r}], 'foo.pkg.tar.zst', timeout=3)\n"
+        "print(next(race))\n"
+        "race.close()\n"
+    )
+    started = time.monotonic()
+    out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=60,
+                         env={**os.environ, "PYTHONPATH": SRC})
+    elapsed = time.monotonic() - started
+    assert out.stdout.strip().splitlines()[-1] == fast.url
+    # Yanıt vermeyen mirror'ın yoklaması (3 sn zaman aşımı, yeniden denemeler) beklenmeden çıkılır
+    assert elapsed < 3
+
+
+# fetch_index
+
+def test_fetch_index_serves_fresh_copy_and_revalidates_stale_one(mirror, cache_dir, monkeypatch):
+    server = mirror({"foo.pkg.tar.zst": b"x"})
+    assert archcraftpkg.get_files_json(server.url) == [{"name": "foo.pkg.tar.zst", "type": "file"}]
+    assert archcraftpkg.get_files_json(server.url) == [{"name": "foo.pkg.tar.zst", "type": "file"}]
+    assert len(server.fetched("files.json")) == 1
+    monkeypatch.setattr(archcraftpkg, "INDEX_TTL", 0)
+    assert archcraftpkg.get_files_json(server.url) == [{"name": "foo.pkg.tar.zst", "type": "file"}]
+    requests = server.fetched("files.json")
+    assert len(requests) == 2
+    assert requests[1][2].get("If-None-Match") == '"1"'
+
+def test_fetch_index_concurrent_cold_fetches(mirror, cache_dir):
+    server = mirror({"foo.pkg.tar.zst": b"x"})
+    results = [None] * 6
+
+    def fetch(i):
+        results[i] = archcraftpkg.get_files_json(server.url)
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(len(results))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [[{"name": "foo.pkg.tar.zst", "type": "file"}]] * len(results)
+    assert len(server.fetched("files.json")) == 1
+    assert [p.name for p in (cache_dir / "index").iterdir() if p.suffix == ".tmp"] == []
+
+
+# download_file
+
+PAYLOAD = os.urandom(300 * 1024)
+
+def etag_of(server, name):
+    import urllib.request
+    with urllib.request.urlopen(urllib.request.Request(f"{server.url}/{name}", method="HEAD")) as r:
+        return r.headers["ETag"]
+
+def test_download_file_resumes_matching_part(mirror, cache_dir):
+    server = mirror({"foo.pkg.tar.zst": PAYLOAD})
+    (cache_dir / "foo.pkg.tar.zst.part").write_bytes(PAYLOAD[:1000])
+    (cache_dir / "foo.pkg.tar.zst.part.validator").write_text(etag_of(server, "foo.pkg.tar.zst"))
+    assert archcraftpkg.download_file(f"{server.url}/foo.pkg.tar.zst", "foo.pkg.tar.zst")
+    assert (cache_dir / "foo.pkg.tar.zst").read_bytes() == PAYLOAD
+    headers = server.fetched("foo.pkg.tar.zst")[-1][2]
+    assert headers["Range"] == "bytes=1000-"
+    assert headers["If-Range"] == etag_of(server, "foo.pkg.tar.zst")
+    assert sorted(p.name for p in cache_dir.iterdir()) == ["foo.pkg.tar.zst", "foo.pkg.tar.zst.validator"]
+
+def test_download_file_restarts_part_from_another_version(mirror, cache_dir):
+    server = mirror({"foo.pkg.tar.zst": PAYLOAD})
+    (cache_dir / "foo.pkg.tar.zst.part").write_bytes(b"old release bytes")
+    (cache_dir / "foo.pkg.tar.zst.part.validator").write_text('"old-etag"')
+    assert archcraftpkg.download_file(f"{server.url}/foo.pkg.tar.zst", "foo.pkg.tar.zst")
+    assert (cache_dir / "foo.pkg.tar.zst").read_bytes() == PAYLOAD
+
+def test_download_file_does_not_resume_part_without_validator(mirror, cache_dir):
+    server = mirror({"foo.pkg.tar.zst": PAYLOAD})
+    (cache_dir / "foo.pkg.tar.zst.part").write_bytes(b"x" * 1000)
+    assert archcraftpkg.download_file(f"{server.url}/foo.pkg.tar.zst", "foo.pkg.tar.zst")
+    assert (cache_dir / "foo.pkg.tar.zst").read_bytes() == PAYLOAD
+    assert "Range" not in server.fetched("foo.pkg.tar.zst")[-1][2]
+
+def test_download_file_restarts_on_misplaced_content_range(mirror, cache_dir):
+    server = mirror({"foo.pkg.tar.zst": PAYLOAD})
+    server.misplaced_ranges = True
+    (cache_dir / "foo.pkg.tar.zst.part").write_bytes(PAYLOAD[:1000])
+    (cache_dir / "foo.pkg.tar.zst.part.validator").write_text(etag_of(server, "foo.pkg.tar.zst"))
+    assert archcraftpkg.download_file(f"{server.url}/foo.pkg.tar.zst", "foo.pkg.tar.zst")
+    assert (cache_dir / "foo.pkg.tar.zst").read_bytes() == PAYLOAD
+    assert len(server.fetched("foo.pkg.tar.zst")) == 2
+
+def test_download_file_accepts_complete_part_on_416(mirror, cache_dir):
+    server = mirror({"foo.pkg.tar.zst": PAYLOAD})
+    (cache_dir / "foo.pkg.tar.zst.part").write_bytes(PAYLOAD)
+    (cache_dir / "foo.pkg.tar.zst.part.validator").write_text(etag_of(server, "foo.pkg.tar.zst"))
+    assert archcraftpkg.download_file(f"{server.url}/foo.pkg.tar.zst", "foo.pkg.tar.zst")
+    assert (cache_dir / "foo.pkg.tar.zst").read_bytes() == PAYLOAD
+    assert len(server.fetched("foo.pkg.tar.zst")) == 1
+
+def test_download_file_reports_missing_file(mirror, cache_dir):
+    server = mirror({})
+    assert not archcraftpkg.download_file(f"{server.url}/foo.pkg.tar.zst", "foo.pkg.tar.zst")
+    assert not (cache_dir / "foo.pkg.tar.zst").exists()
+
+
+# Paket veritabanı: çakışmalar ve kaldırma
+
+@pytest.fixture
+def pkgdb(tmp_path, monkeypatch):
+    monkeypatch.setattr(archcraftpkg, "PKG_DB", tmp_path / "installed")
+    monkeypatch.setattr(archcraftpkg, "PKG_DB_FILE", tmp_path / "packages.db")
+
+    def install(name, version=None, pkg_hash=None, paths=None):
+        conn = archcraftpkg.pkgdb_connect()
+        try:
+            with conn:
+                archcraftpkg.pkgdb_write(conn, name, paths or [f"/usr/share/{name}/file"],
+                                         version=version, pkg_hash=pkg_hash)
+        finally:
+            conn.close()
+    return install
+
+def test_register_package_reports_file_conflicts(pkgdb):
+    assert archcraftpkg.register_package("a", ["usr/bin/", "usr/bin/tool"]) == []
+    assert archcraftpkg.register_package("b", ["usr/bin/", "usr/bin/tool", "usr/bin/other"]) == [("/usr/bin/tool", "a")]
+    assert archcraftpkg.pkgdb_packages() == ["a"]
+    # Ortak dizinler çakışma sayılmaz
+    assert archcraftpkg.register_package("c", ["usr/bin/", "usr/bin/third"]) == []
+
+def test_remove_keeps_directories_with_foreign_files(pkgdb, tmp_path):
+    root = tmp_path / "root"
+    (root / "share" / "docs").mkdir(parents=True)
+    for name in ("share/docs/a.txt", "share/b.txt", "share/a.conf"):
+        (root / name).write_text(name)
+    rel = str(root).lstrip("/")
+    archcraftpkg.register_package("a", [f"{rel}/share/", f"{rel}/share/docs/", f"{rel}/share/docs/a.txt", f"{rel}/share/a.conf"])
+    # b dizinin kendisini değil, yalnızca içindeki bir dosyayı sahiplenir
+    archcraftpkg.register_package("b", [f"{rel}/share/b.txt"])
+    archcraftpkg.remove("a", assume_yes=True)
+    assert sorted(p.name for p in (root / "share").iterdir()) == ["b.txt"]
+    assert archcraftpkg.pkgdb_packages() == ["b"]
+    assert archcraftpkg.pkgdb_owners(str(root / "share" / "b.txt")) == ["b"]
+
+def test_remove_never_deletes_untracked_contents(pkgdb, tmp_path):
+    root = tmp_path / "root"
+    (root / "data").mkdir(parents=True)
+    (root / "data" / "tracked").write_text("x")
+    (root / "data" / "user-file").write_text("keep me")
+    rel = str(root).lstrip("/")
+    archcraftpkg.register_package("a", [f"{rel}/data/", f"{rel}/data/tracked"])
+    archcraftpkg.remove("a", assume_yes=True)
+    assert sorted(p.name for p in (root / "data").iterdir()) == ["user-file"]
+    assert archcraftpkg.pkgdb_packages() == []
+
+
+# Paket önbelleği
+
+@pytest.fixture
+def pkg_cache(cache_dir, pkgdb, monkeypatch):
+    monkeypatch.setattr(archcraftpkg, "PKG_CACHE_DIR", cache_dir / "pkgs")
+
+    def store(name, data, source=None, validator=None):
+        pkg = f"{name}.pkg.tar.zst"
+        (cache_dir / pkg).write_bytes(data)
+        (cache_dir / f"{pkg}.sig").write_bytes(b"sig")
+        if validator:
+            (cache_dir / f"{pkg}.validator").write_text(validator)
+        pkg_hash = archcraftpkg.file_sha256(cache_dir / pkg)
+        archcraftpkg.cache_store(name, pkg_hash, source=source)
+        for path in (pkg, f"{pkg}.sig", f"{pkg}.validator"):
+            (cache_dir / path).unlink(missing_ok=True)
+        return pkg_hash
+    return store
+
+def test_cache_lookup_by_hash_skips_the_network(pkg_cache, cache_dir):
+    pkg_hash = pkg_cache("foo", b"v1")
+    assert archcraftpkg.cache_lookup("foo", pkg_hash) == pkg_hash
+    assert (cache_dir / "foo.pkg.tar.zst").read_bytes() == b"v1"
+    assert archcraftpkg.cache_lookup("foo", "0" * 64) is None
+
+def test_cache_lookup_by_name_revalidates_against_the_mirror(pkg_cache, mirror):
+    server = mirror({"foo.pkg.tar.zst": b"v1"})
+    url = f"{server.url}/foo.pkg.tar.zst"
+    pkg_hash = pkg_cache("foo", b"v1", source=url, validator=etag_of(server, "foo.pkg.tar.zst"))
+    assert archcraftpkg.cache_lookup("foo") == pkg_hash
+    assert [r[0] for r in server.requests if r[1] == "/foo.pkg.tar.zst"] == ["HEAD", "HEAD"]
+    # Mirror'da yeni bir sürüm var: önbellek kullanılmaz
+    server.files["foo.pkg.tar.zst"] = b"v2"
+    assert archcraftpkg.cache_lookup("foo") is None
+
+def test_cache_lookup_by_name_without_validator_misses(pkg_cache):
+    pkg_cache("foo", b"v1")
+    assert archcraftpkg.cache_lookup("foo") is None
+
+def test_cache_lookup_by_name_offline_trusts_the_cache(pkg_cache, monkeypatch):
+    pkg_hash = pkg_cache("foo", b"v1")
+    monkeypatch.setattr(archcraftpkg, "INDEX_OFFLINE", True)
+    assert archcraftpkg.cache_lookup("foo") == pkg_hash
+
+def test_cache_prune_evicts_least_recently_used_unpinned_blobs(pkg_cache, pkgdb):
+    old = pkg_cache("old", b"a" * 100)
+    pinned = pkg_cache("pinned", b"b" * 100)
+    recent = pkg_cache("recent", b"c" * 100)
+    index = archcraftpkg.load_pkg_cache_index()
+    for age, pkg_hash in enumerate((recent, pinned, old)):
+        index["blobs"][pkg_hash]["last_used"] = 1000 - age
+    archcraftpkg.save_pkg_cache_index(index)
+    pkgdb("pinned", pkg_hash=pinned)
+    # Her blob 103 bayt (paket + imza); bütçe ikisine yeter
+    assert archcraftpkg.cache_prune(budget=250) == 103
+    assert sorted(archcraftpkg.load_pkg_cache_index()["blobs"]) == sorted([pinned, recent])
+    assert archcraftpkg.cache_prune(budget=0) == 103
+    assert list(archcraftpkg.load_pkg_cache_index()["blobs"]) == [pinned]
+
+def test_downloaded_package_is_cached_with_its_validator(pkg_cache, mirror, cache_dir):
+    server = mirror({"foo.pkg.tar.zst": PAYLOAD})
+    url = f"{server.url}/foo.pkg.tar.zst"
+    assert archcraftpkg.download_file(url, "foo.pkg.tar.zst")
+    (cache_dir / "foo.pkg.tar.zst.sig").write_bytes(b"sig")
+    pkg_hash = archcraftpkg.file_sha256(cache_dir / "foo.pkg.tar.zst")
+    archcraftpkg.cache_store("foo", pkg_hash, source=url)
+    assert archcraftpkg.load_pkg_cache_index()["blobs"][pkg_hash]["validator"] == etag_of(server, "foo.pkg.tar.zst")
+    assert archcraftpkg.cache_lookup("foo") == pkg_hash
+
+
+# Snapshot'lar
+
+def test_snapshot_save_and_read_round_trip(pkgdb, tmp_path):
+    archcraftpkg.register_package("foo", ["usr/bin/foo"], "core", "STABLE", "aaa", "1.0-1")
+    archcraftpkg.snapshot_save(str(tmp_path / "snap.json"))
+    assert archcraftpkg.read_snapshot(str(tmp_path / "snap.json")) == [
+        {"name": "foo", "version": "1.0-1", "repo": "core", "release": "STABLE", "hash": "aaa"},
+    ]
+
+def test_read_snapshot_legacy_name_list(tmp_path):
+    (tmp_path / "snap.txt").write_text("foo\nbar\n\nfoo\n")
+    assert archcraftpkg.read_snapshot(str(tmp_path / "snap.txt")) == [{"name": "foo"}, {"name": "bar"}]
+
+def test_snapshot_plan(pkgdb):
+    pkgdb("same", "1.0", "aaa")
+    pkgdb("rehashed", "1.0", "bbb")
+    pkgdb("upgraded", "1.0")
+    pkgdb("extra", "1.0")
+    entries = [
+        {"name": "same", "version": "1.0", "hash": "aaa"},
+        {"name": "rehashed", "version": "1.0", "hash": "ccc"},
+        {"name": "upgraded", "version": "2.0"},
+        {"name": "missing", "version": "1.0"},
+    ]
+    installs, removals, unchanged = archcraftpkg.snapshot_plan(entries)
+    assert [(entry["name"], reason) for entry, reason in installs] == [
+        ("rehashed", "hash differs"),
+        ("upgraded", "version 1.0 → 2.0"),
+        ("missing", "missing"),
+    ]
+    assert removals == ["extra"]
+    assert unchanged == ["same"]
+
+def test_snapshot_plan_empty_snapshot_removes_everything(pkgdb):
+    pkgdb("a")
+    pkgdb("b")
+    assert archcraftpkg.snapshot_plan([]) == ([], ["a", "b"], [])
+
+def test_mirror_origin_maps_url_back_to_repo_release(tmp_path, monkeypatch):
+    mirrorlist = tmp_path / "mirrorpkglist"
+    mirrorlist.write_text(
+        "#repo=core\n#repopkgreleasedate=stable\nSERVER=http://a.example/core/$arch/\n"
+        "#repo=extra\n#repopkgreleasedate=testing\nSERVER=http://b.example/extra/$arch\n"
+    )
+    monkeypatch.setattr(archcraftpkg, "MIRRORLIST", str(mirrorlist))
+    monkeypatch.setattr(archcraftpkg, "get_arch", lambda: "x86_64")
+    assert archcraftpkg.mirror_origin("http://a.example/core/x86_64") == ("core", "STABLE")
+    assert archcraftpkg.mirror_origin("http://b.example/extra/x86_64?token=1") == ("extra", "TESTING")
+    assert archcraftpkg.mirror_origin("http://c.example/x86_64") == (None, None)
+
+
+# sync ve arama
+
+NAMES = sorted(["firefox", "firefox-esr", "libfire", "python", "python-requests", "vim"])
+
+def kinds(query, fuzzy=False):
+    return [(NAMES[i], kind) for i, kind in archcraftpkg.search_index(query, NAMES, fuzzy)]
+
+def test_search_index_orders_exact_prefix_substring():
+    assert kinds("firefox") == [("firefox", "exact"), ("firefox-esr", "prefix")]
+    assert kinds("fire") == [("firefox", "prefix"), ("firefox-esr", "prefix"), ("libfire", "substring")]
+
+def test_search_index_falls_back_to_fuzzy():
+    assert kinds("pyhton") == [("python", "fuzzy")]
+    assert kinds("vim", fuzzy=True)[0] == ("vim", "exact")
+
+def test_search_index_no_match():
+    assert kinds("zzzzzz") == []
+
+def test_sync_builds_search_index_and_revalidates(mirror, cache_dir, monkeypatch, tmp_path):
+    core = mirror({"vim.pkg.tar.zst": b"", "vim.pkg.tar.zst.sig": b"", "python.pkg.tar.zst": b""})
+    extra = mirror({"vim.pkg.tar.zst": b""})
+    mirrorlist = tmp_path / "mirrorpkglist"
+    mirrorlist.write_text(
+        f"#repo=core\n#repopkgreleasedate=stable\nSERVER={core.url}\n"
+        f"#repo=extra\n#repopkgreleasedate=testing\nSERVER={extra.url}\n"
+    )
+    monkeypatch.setattr(archcraftpkg, "MIRRORLIST", str(mirrorlist))
+    monkeypatch.setattr(archcraftpkg, "SEARCH_INDEX", cache_dir / "search.idx")
+    archcraftpkg.sync()
+    assert archcraftpkg.load_search_index() == (["python", "vim"], ["core/STABLE", "core/STABLE,extra/TESTING"])
+    # TTL içinde olsa da sync koşullu GET ile yeniden doğrular
+    archcraftpkg.sync()
+    requests = core.fetched("files.json")
+    assert len(requests) == 2
+    assert requests[1][2].get("If-None-Match") == '"3"'
+
+
+# HTTP bağlantı havuzu
+
+@pytest.fixture
+def http_pool(monkeypatch):
+    monkeypatch.setattr(archcraftpkg, "http_pool", {})
+    monkeypatch.setattr(archcraftpkg, "HTTP_BACKOFF", 0)
+
+def test_http_open_reuses_pooled_connections(mirror, http_pool):
+    server = mirror({"a": b"1", "b": b"22"})
+    for name in ("a", "b", "a"):
+        with archcraftpkg.http_open(f"{server.url}/{name}") as response:
+            assert response.read() == server.files[name]
+    assert len({r[3] for r in server.requests}) == 1
+
+def test_http_open_retries_server_errors(mirror, http_pool):
+    server = mirror({"a": b"1"})
+    server.failures = archcraftpkg.HTTP_RETRIES - 1
+    with archcraftpkg.http_open(f"{server.url}/a") as response:
+        assert response.read() == b"1"
+    assert len(server.requests) == archcraftpkg.HTTP_RETRIES
+
+def test_http_open_gives_up_after_retries(mirror, http_pool):
+    import urllib.error
+
+    server = mirror({"a": b"1"})
+    server.failures = archcraftpkg.HTTP_RETRIES + 1
+    with pytest.raises(urllib.error.HTTPError) as e:
+        with archcraftpkg.http_open(f"{server.url}/a"):
+            pass
+    assert e.value.code == 503
+    assert len(server.requests) == archcraftpkg.HTTP_RETRIES
+
+def test_http_open_retries_refused_connections(http_pool):
+    import urllib.error
+
+    sock = socket.create_server(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    with pytest.raises(urllib.error.URLError):
+        with archcraftpkg.http_open(f"http://127.0.0.1:{port}/a"):
+            pass
+
+
+# İndirme sırasında imza doğrulama
+
+@pytest.fixture(scope="module")
+def signer(tmp_path_factory):
+    import shutil
+
+    if not shutil.which("gpg"):
+        pytest.skip("gpg is not installed")
+    home = tmp_path_factory.mktemp("gpg")
+    os.chmod(home, 0o700)
+    gpg = ["gpg", "--homedir", str(home), "--batch", "--quiet"]
+    subprocess.run([*gpg, "--passphrase", "", "--quick-gen-key", "test@example.org", "ed25519", "sign", "never"],
+                   check=True, capture_output=True)
+
+    def sign(data):
+        return subprocess.run([*gpg, "--detach-sign", "-o", "-"], input=data, check=True, capture_output=True).stdout
+    yield str(home), sign
+    subprocess.run(["gpgconf", "--homedir", str(home), "--kill", "all"], capture_output=True)
+
+def test_download_package_from_verifies_while_downloading(signer, mirror, cache_dir):
+    import hashlib
+
+    gpg_dir, sign = signer
+    server = mirror({"foo.pkg.tar.zst": PAYLOAD, "foo.pkg.tar.zst.sig": sign(PAYLOAD)})
+    pkg_hash = archcraftpkg.download_package_from(server.url, "foo.pkg.tar.zst", "foo.pkg.tar.zst.sig", gpg_dir=gpg_dir)
+    assert pkg_hash == hashlib.sha256(PAYLOAD).hexdigest()
+    assert (cache_dir / "foo.pkg.tar.zst").read_bytes() == PAYLOAD
+
+def test_download_package_from_drops_package_with_bad_signature(signer, mirror, cache_dir, capsys):
+    gpg_dir, sign = signer
+    server = mirror({"foo.pkg.tar.zst": PAYLOAD, "foo.pkg.tar.zst.sig": sign(b"another package")})
+    assert archcraftpkg.download_package_from(server.url, "foo.pkg.tar.zst", "foo.pkg.tar.zst.sig", gpg_dir=gpg_dir) is None
+    assert not [p.name for p in cache_dir.iterdir() if p.name.startswith("foo.pkg.tar.zst") and ".sig" not in p.name]
+
+def test_download_package_from_reports_download_errors(signer, mirror, cache_dir, capsys):
+    gpg_dir, sign = signer
+    server = mirror({"foo.pkg.tar.zst.sig": sign(PAYLOAD)})
+    assert archcraftpkg.download_package_from(server.url, "foo.pkg.tar.zst", "foo.pkg.tar.zst.sig", gpg_dir=gpg_dir) is None
+    out = capsys.readouterr().out
+    assert "Failed to download" in out and "404" in out
+    assert "signature" not in out.lower().replace("foo.pkg.tar.zst.sig", "")
+
+
+# Paket açma
+
+def test_safe_member_path_accepts_relative_names(tmp_path):
+    path, rel = archcraftpkg.safe_member_path(str(tmp_path), "./usr//bin/foo")
+    assert path == os.path.join(str(tmp_path), "usr", "bin", "foo")
+    assert rel == "usr/bin/foo"
+
+@pytest.mark.parametrize("name", ["/etc/passwd", "../escape", "usr/../../escape", "", "./"])
+def test_safe_member_path_rejects_unsafe_names(tmp_path, name):
+    with pytest.raises(ValueError):
+        archcraftpkg.safe_member_path(str(tmp_path), name)
+
+def test_safe_member_path_rejects_symlinked_parent(tmp_path):
+    dest = tmp_path / "dest"
+    outside = tmp_path / "outside"
+    dest.mkdir()
+    outside.mkdir()
+    # Daha önce açılmış bir paketin bıraktığı symlink
+    (dest / "link").symlink_to(outside)
+    with pytest.raises(ValueError):
+        archcraftpkg.safe_member_path(str(dest), "link/payload")
+
+def test_safe_member_path_allows_symlink_inside_dest(tmp_path):
+    (tmp_path / "real").mkdir()
+    (tmp_path / "link").symlink_to("real")
+    _, rel = archcraftpkg.safe_member_path(str(tmp_path), "link/file")
+    assert rel == "link/file"
+
+def test_prepare_member_unlinks_existing_symlink(tmp_path):
+    import tarfile
+
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    target = tmp_path / "victim"
+    target.write_text("keep")
+    (dest / "file").symlink_to(target)
+    path, _ = archcraftpkg.prepare_member(str(dest), tarfile.TarInfo("file"))
+    assert not os.path.lexists(path)
+    assert target.read_text() == "keep"
+
+def test_prepare_member_rejects_escaping_hardlink(tmp_path):
+    import tarfile
+
+    member = tarfile.TarInfo("file")
+    member.type = tarfile.LNKTYPE
+    member.linkname = "../victim"
+    with pytest.raises(ValueError):
+        archcraftpkg.prepare_member(str(tmp_path), member)
+
+def build_package(cache_dir, members):
+    # members: (ad, içerik) ya da (ad, "->hedef") symlink'i
+    import io
+    import shutil
+    import tarfile
+
+    if not shutil.which("zstd"):
+        pytest.skip("zstd is not installed")
+    tar_path = cache_dir / "test.pkg.tar"
+    with tarfile.open(tar_path, "w") as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            if isinstance(data, str):
+                info.type = tarfile.SYMTYPE
+                info.linkname = data[2:]
+                tar.addfile(info)
+            else:
+                info.size = len(data)
+                info.mode = 0o644
+                tar.addfile(info, io.BytesIO(data))
+    subprocess.run(["zstd", "-q", "-f", "--rm", str(tar_path)], check=True)
+    return tar_path.name + ".zst"
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_extract_package(cache_dir, threads):
+    pkg = build_package(cache_dir, [("test/usr/bin/tool", b"#!/bin/sh\n"), ("test/usr/share/doc", b"x" * 5000)])
+    files, extract_dir = archcraftpkg.extract(pkg, threads)
+    assert sorted(files) == ["test/usr/bin/tool", "test/usr/share/doc"]
+    assert extract_dir == cache_dir / "test"
+    assert (cache_dir / "test/usr/share/doc").read_bytes() == b"x" * 5000
+
+@pytest.mark.parametrize("threads", [1, 4])
+@pytest.mark.parametrize("members", [
+    [("../evil", b"x")],
+    [("test/link", "->../../outside"), ("test/link/evil", b"x")],
+])
+def test_extract_rejects_escaping_members(cache_dir, tmp_path, threads, members):
+    (tmp_path / "outside").mkdir()
+    pkg = build_package(cache_dir, members)
+    with pytest.raises(ValueError):
+        archcraftpkg.extract(pkg, threads)
+    assert list((tmp_path / "outside").iterdir()) == []
+    assert not (tmp_path / "evil").exists()
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_extract_rejects_symlink_left_by_earlier_package(cache_dir, tmp_path, threads):
+    (tmp_path / "outside").mkdir()
+    (cache_dir / "test").mkdir()
+    (cache_dir / "test" / "link").symlink_to(tmp_path / "outside")
+    pkg = build_package(cache_dir, [("test/link/evil", b"x")])
+    with pytest.raises(ValueError):
+        archcraftpkg.extract(pkg, threads)
+    assert list((tmp_path / "outside").iterdir()) == []
@@ -0,0 +1,728 @@
+import hashlib
+import os
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+import makepkgbuild  # noqa: E402
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Derleme dizini; MAKEPKGBUILD yolları cwd'ye göre çözülür
+    work = tmp_path / "work"
+    work.mkdir()
+    monkeypatch.chdir(work)
+    monkeypatch.setattr(makepkgbuild, "CHECKSUMS", {})
+    monkeypatch.setattr(makepkgbuild, "DIGEST_CACHE", str(tmp_path / "digests.json"))
+    monkeypatch.setattr(makepkgbuild, "digest_cache", None)
+    monkeypatch.setattr(makepkgbuild, "BUILD_CACHE_DIR", None)
+    return work
+
+
+# setup adımlarının bağımlılıkları
+
+def http(target):
+    return ("", ({"type": "http", "url": "http://example.org/x"}, target))
+
+def local(source, target):
+    return ("", ({"type": "file", "path": source}, target))
+
+def test_setup_dependencies_independent_steps():
+    steps = [http("/b/one"), http("/b/two"), ("", None)]
+    assert makepkgbuild.setup_dependencies(steps) == [[], [], []]
+
+def test_setup_dependencies_conflicting_targets():
+    steps = [http("/b/dir"), http("/b/dir/file"), http("/b/other"), http("/b/dir")]
+    assert makepkgbuild.setup_dependencies(steps) == [[], [0], [], [0, 1]]
+
+def test_setup_dependencies_relative_target_and_absolute_source(workdir):
+    steps = [http("out/data"), local(str(workdir / "out" / "data"), "/b/copy")]
+    assert makepkgbuild.setup_dependencies(steps) == [[], [0]]
+
+def test_setup_dependencies_file_source_waits_for_writer():
+    steps = [http("/b/data"), local("/b/data", "/b/copy"), ("", None), local("/src/x", "/b/data/x")]
+    assert makepkgbuild.setup_dependencies(steps) == [[], [0], [], [0, 1]]
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_run_setup_group_places_files_and_keeps_log_order(workdir, capsys, workers):
+    sources = []
+    for i in range(4):
+        source = workdir.parent / f"src{i}"
+        source.write_bytes(b"%d" % i * 1000)
+        sources.append(f"data://file{source}")
+    cmds = [f"setup -Dm644 data_env{i + 1}:src:out/{i}" for i in range(4)]
+    # İkinci komut, birincinin hedefini kaynak olarak okur
+    sources[1] = f"data://file{workdir}/out/0"
+    makepkgbuild.run_setup_group(cmds, sources, workers=workers)
+    assert (workdir / "out/1").read_bytes() == b"0" * 1000
+    assert (workdir / "out/3").read_bytes() == b"3" * 1000
+    logged = [line for line in capsys.readouterr().out.splitlines() if line.startswith("[BUILD]")]
+    assert logged == [f"[BUILD] > {cmd}" for cmd in cmds]
+
+
+# Akış halinde indirme ve CHECKSUM
+
+PAYLOAD = os.urandom(300 * 1024)
+
+class UpstreamStandIn:
+    # Range destekleyen (ranges=False ise yok sayan) küçük HTTP sunucusu
+    def __init__(self, files, ranges=True):
+        self.files = files
+        self.ranges = ranges
+        self.requests = []
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(head=True)
+
+            def do_GET(self):
+                self.respond(head=False)
+
+            def respond(self, head):
+                upstream.requests.append((self.command, self.path, self.headers.get("Range")))
+                body = upstream.files.get(self.path)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                start = 0
+                byte_range = self.headers.get("Range")
+                if byte_range and upstream.ranges:
+                    start = int(byte_range.split("=")[1].split("-")[0])
+                    if start >= len(body):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(body)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(body) - start))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body[start:])
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def upstream():
+    servers = []
+
+    def start(files=None, ranges=True):
+        server = UpstreamStandIn(dict(files or {"/payload.bin": PAYLOAD}), ranges)
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.close()
+
+def expect(dest, data, algorithm="sha256"):
+    makepkgbuild.CHECKSUMS[os.path.abspath(dest)] = hashlib.new(algorithm, data).hexdigest()
+
+def test_stream_download_verifies_checksum(workdir, upstream):
+    server = upstream()
+    dest = str(workdir / "out" / "payload.bin")
+    expect(dest, PAYLOAD, "sha512")
+    assert makepkgbuild.stream_download(f"{server.url}/payload.bin", dest) == hashlib.sha512(PAYLOAD).hexdigest()
+    assert open(dest, "rb").read() == PAYLOAD
+    assert not os.path.exists(dest + ".part")
+
+def test_stream_download_resumes_part_file(workdir, upstream):
+    server = upstream()
+    dest = str(workdir / "payload.bin")
+    with open(dest + ".part", "wb") as f:
+        f.write(PAYLOAD[:1000])
+    expect(dest, PAYLOAD)
+    makepkgbuild.stream_download(f"{server.url}/payload.bin", dest)
+    assert server.requests == [("GET", "/payload.bin", "bytes=1000-")]
+    assert open(dest, "rb").read() == PAYLOAD
+
+def test_stream_download_restarts_without_range_support(workdir, upstream):
+    server = upstream(ranges=False)
+    dest = str(workdir / "payload.bin")
+    with open(dest + ".part", "wb") as f:
+        f.write(b"stale")
+    expect(dest, PAYLOAD)
+    makepkgbuild.stream_download(f"{server.url}/payload.bin", dest)
+    assert open(dest, "rb").read() == PAYLOAD
+
+def test_stream_download_accepts_complete_part_on_416(workdir, upstream):
+    server = upstream()
+    dest = str(workdir / "payload.bin")
+    with open(dest + ".part", "wb") as f:
+        f.write(PAYLOAD)
+    expect(dest, PAYLOAD)
+    makepkgbuild.stream_download(f"{server.url}/payload.bin", dest)
+    assert len(server.requests) == 1
+    assert open(dest, "rb").read() == PAYLOAD
+
+def test_stream_download_restarts_oversized_part_on_416(workdir, upstream):
+    server = upstream()
+    dest = str(workdir / "payload.bin")
+    with open(dest + ".part", "wb") as f:
+        f.write(PAYLOAD + b"trailing bytes of another file")
+    expect(dest, PAYLOAD)
+    makepkgbuild.stream_download(f"{server.url}/payload.bin", dest)
+    assert [r[2] for r in server.requests] == [f"bytes={len(PAYLOAD) + 30}-", None]
+    assert open(dest, "rb").read() == PAYLOAD
+
+def test_stream_download_checksum_mismatch(workdir, upstream):
+    server = upstream()
+    dest = str(workdir / "payload.bin")
+    expect(dest, b"something else")
+    with pytest.raises(makepkgbuild.ChecksumError):
+        makepkgbuild.stream_download(f"{server.url}/payload.bin", dest)
+    assert not os.path.exists(dest)
+    assert not os.path.exists(dest + ".part")
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_checksum_mismatch_stops_the_build(workdir, upstream, workers):
+    server = upstream()
+    expect(str(workdir / "out/a.bin"), b"something else")
+    cmds = ["setup -Dm644 data_env1:src:out/a.bin", "setup -Dm644 data_env1:src:out/b.bin"]
+    with pytest.raises(SystemExit) as e:
+        makepkgbuild.run_setup_group(cmds, [f"{server.url}/payload.bin"], workers=workers)
+    assert e.value.code == 1
+    assert not (workdir / "out/a.bin").exists()
+
+def test_process_checksum_defers_only_missing_files(workdir, capsys):
+    (workdir / "present").write_bytes(b"data")
+    entries = [
+        (hashlib.sha256(b"data").hexdigest(), "present"),
+        ("sha256:" + "0" * 64, "remote.bin"),
+        ("sha256:" + "0" * 64, "built.bin"),
+    ]
+    deferred = makepkgbuild.process_checksum(entries, {str(workdir / "remote.bin")})
+    assert deferred == entries[1:]
+    out = capsys.readouterr().out
+    assert "[OK] Checksum verified: present" in out
+    assert "[INFO] Checksum deferred until download: remote.bin" in out
+    assert "[INFO] Checksum deferred until the build finishes: built.bin" in out
+    assert makepkgbuild.process_checksum(entries[2:], after_build=True) == []
+    assert "[ERR] Checksum file not found: built.bin" in capsys.readouterr().out
+
+def test_process_checksum_mismatch_exits(workdir):
+    (workdir / "present").write_bytes(b"data")
+    with pytest.raises(SystemExit) as e:
+        makepkgbuild.process_checksum([("0" * 64, "present")])
+    assert e.value.code == 1
+
+def test_remote_setup_targets(workdir):
+    cmds = ["setup -Dm644 data_env1:src:a.bin", "setup -Dm644 data_env2:src:{PATH_ENV}/b.bin",
+            "setup -Dm644 data_env3:src:c.bin", "echo hi"]
+    upstreams = ["https://example.org/a", "ftp://example.org/b", "data://file/tmp/c"]
+    assert makepkgbuild.remote_setup_targets(cmds, upstreams) == {str(workdir / "a.bin"), str(workdir / "b.bin")}
+
+def write_makepkgbuild(workdir, source, checksum):
+    (workdir / "MAKEPKGBUILD").write_text(
+        "name=test\n"
+        f'upstream=("data://file{source}")\n'
+        f'CHECKSUM=("{checksum}...out/copy.bin")\n'
+        "\n"
+        "BUILD()\n"
+        "setup -Dm644 data_env1:src:out/copy.bin\n"
+    )
+
+def test_main_verifies_data_file_outputs_after_the_build(workdir, monkeypatch, capsys):
+    source = workdir.parent / "source.bin"
+    source.write_bytes(PAYLOAD)
+    monkeypatch.setattr(sys, "argv", ["makepkgbuild", "--no-build-cache"])
+    write_makepkgbuild(workdir, source, hashlib.sha256(PAYLOAD).hexdigest())
+    makepkgbuild.main()
+    assert "[OK] Checksum verified: out/copy.bin" in capsys.readouterr().out
+    write_makepkgbuild(workdir, source, "0" * 64)
+    with pytest.raises(SystemExit) as e:
+        makepkgbuild.main()
+    assert e.value.code == 1
+    assert "[ERR] Checksum mismatch for out/copy.bin" in capsys.readouterr().out
+
+
+# Checksum motoru
+
+def test_split_checksum_infers_algorithm_from_length():
+    assert makepkgbuild.split_checksum("a" * 64) == ("sha256", "a" * 64)
+    assert makepkgbuild.split_checksum(" " + "B" * 32 + "\n") == ("md5", "b" * 32)
+
+def test_split_checksum_explicit_prefix():
+    assert makepkgbuild.split_checksum("SHA512:ABC") == ("sha512", "abc")
+
+@pytest.mark.parametrize("value", ["abc", "nosuchalgo:abc"])
+def test_split_checksum_rejects_unknown(value):
+    with pytest.raises(ValueError):
+        makepkgbuild.split_checksum(value)
+
+def test_checksum_matches():
+    digest = hashlib.sha256(b"data").hexdigest()
+    assert makepkgbuild.checksum_matches(digest.upper(), digest)
+    assert makepkgbuild.checksum_matches(digest, f"sha256:{digest}")
+    assert not makepkgbuild.checksum_matches("0" * 64, digest)
+
+def test_parse_checksums_formats():
+    entries = makepkgbuild.parse_checksums([
+        "abc...src/file.tar",
+        " data.bin:def ",
+        "sha512:0123...a.txt",
+        "broken",
+        "...missing",
+    ])
+    assert entries == [("abc", "src/file.tar"), ("def", "data.bin"), ("sha512:0123", "a.txt")]
+
+@pytest.mark.parametrize("size", [0, 1, 3 * 1024 * 1024 + 7])
+def test_file_digest(workdir, monkeypatch, size):
+    monkeypatch.setattr(makepkgbuild, "CHECKSUM_BUFFER_SIZE", 1024 * 1024)
+    data = os.urandom(size)
+    (workdir / "f").write_bytes(data)
+    for algorithm in ("md5", "sha256", "sha512"):
+        assert makepkgbuild.file_digest(str(workdir / "f"), algorithm) == hashlib.new(algorithm, data).hexdigest()
+
+def test_file_digest_cache_survives_restart_and_tracks_changes(workdir, monkeypatch):
+    path = workdir / "f"
+    path.write_bytes(b"one")
+    makepkgbuild.file_digest(str(path), "sha256")
+    makepkgbuild.save_digest_cache()
+    # Yeni bir çalıştırma: özet diskteki önbellekten, dosya okunmadan gelir
+    monkeypatch.setattr(makepkgbuild, "digest_cache", None)
+    key = makepkgbuild.digest_key(os.stat(path), "sha256")
+    assert makepkgbuild.load_digest_cache()[key] == hashlib.sha256(b"one").hexdigest()
+    makepkgbuild.load_digest_cache()[key] = "cached"
+    assert makepkgbuild.file_digest(str(path), "sha256") == "cached"
+    # İçerik (boyut/mtime) değişince anahtar da değişir
+    path.write_bytes(b"two!")
+    assert makepkgbuild.file_digest(str(path), "sha256") == hashlib.sha256(b"two!").hexdigest()
+
+def test_process_checksum_reports_in_checksum_order(workdir, capsys):
+    entries = []
+    for i in range(6):
+        (workdir / f"f{i}").write_bytes(b"x" * i)
+        entries.append((hashlib.sha256(b"x" * i).hexdigest(), f"f{i}"))
+    assert makepkgbuild.process_checksum(entries, workers=4) == []
+    assert capsys.readouterr().out.splitlines() == [f"[OK] Checksum verified: f{i}" for i in range(6)]
+
+
+# Derleme önbelleği
+
+@pytest.fixture
+def build_cache(workdir, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "build_cache"
+    monkeypatch.setattr(makepkgbuild, "BUILD_CACHE_DIR", str(cache_dir))
+    monkeypatch.setattr(makepkgbuild, "BUILD_CACHE_BASE", "")
+    monkeypatch.setattr(makepkgbuild, "build_cache_stats", {"hits": 0, "misses": 0, "stored": 0, "evicted": 0})
+    monkeypatch.setattr(makepkgbuild, "build_cache_durations", {})
+    monkeypatch.setattr(makepkgbuild, "shell_session", None)
+    return cache_dir
+
+def test_remote_setup_step_restored_from_cache(build_cache, upstream):
+    server = upstream()
+    expect("out/payload.bin", PAYLOAD)
+    cmd = "setup -Dm644 data_env1:src:out/payload.bin"
+    upstreams = [server.url + "/payload.bin"]
+    makepkgbuild.run_setup(cmd, upstreams)
+    os.remove("out/payload.bin")
+    makepkgbuild.run_setup(cmd, upstreams)
+    with open("out/payload.bin", "rb") as f:
+        assert f.read() == PAYLOAD
+    assert [r for r in server.requests if r[0] == "GET"] == [("GET", "/payload.bin", None)]
+    assert makepkgbuild.build_cache_stats == {"hits": 1, "misses": 1, "stored": 1, "evicted": 0}
+
+def test_remote_setup_step_without_checksum_is_not_cached(build_cache, upstream):
+    server = upstream()
+    makepkgbuild.run_setup("setup -Dm644 data_env1:src:out/payload.bin", [server.url + "/payload.bin"])
+    assert not build_cache.exists()
+
+def test_data_file_setup_step_is_not_cached(build_cache):
+    source = build_cache.parent / "source.bin"
+    source.write_bytes(b"local")
+    makepkgbuild.run_setup("setup -Dm644 data_env1:src:out/copy.bin", [f"data://file{source}"])
+    with open("out/copy.bin", "rb") as f:
+        assert f.read() == b"local"
+    assert not build_cache.exists()
+    assert makepkgbuild.build_cache_stats["misses"] == 0
+
+SHELL_STEP = "mkdir -p dist && cp in.txt dist/out.txt && echo ran >> runs.log  #CACHE in=in.txt out=dist"
+
+def runs():
+    with open("runs.log") as f:
+        return len(f.readlines())
+
+def test_shell_step_with_declared_outputs_is_cached(build_cache, capsys):
+    with open("in.txt", "w") as f:
+        f.write("one")
+    assert makepkgbuild.run_shell_step(SHELL_STEP)
+    os.remove("dist/out.txt")
+    assert makepkgbuild.run_shell_step(SHELL_STEP)
+    assert runs() == 1
+    with open("dist/out.txt") as f:
+        assert f.read() == "one"
+    assert "[CACHE] Hit, restored 1 file(s)" in capsys.readouterr().out
+
+    # Girdi değişince adım yeniden çalışır
+    with open("in.txt", "w") as f:
+        f.write("second")
+    assert makepkgbuild.run_shell_step(SHELL_STEP)
+    assert runs() == 2
+    with open("dist/out.txt") as f:
+        assert f.read() == "second"
+    assert makepkgbuild.build_cache_stats == {"hits": 1, "misses": 2, "stored": 2, "evicted": 0}
+
+def test_shell_step_is_not_cached_in_a_shell_session(build_cache, monkeypatch):
+    with open("in.txt", "w") as f:
+        f.write("one")
+    session = makepkgbuild.ShellSession()
+    monkeypatch.setattr(makepkgbuild, "shell_session", session)
+    try:
+        for _ in range(2):
+            assert makepkgbuild.run_shell_step(SHELL_STEP)
+    finally:
+        session.close()
+    assert runs() == 2
+    assert not build_cache.exists()
+
+@pytest.mark.parametrize("cmd, warning", [
+    ("echo ran >> runs.log", None),
+    ("echo ran >> runs.log  #CACHE in=runs.log", "#CACHE without outputs"),
+    ("echo ran >> runs.log  #CACHE out=missing", "Declared output missing"),
+])
+def test_shell_step_without_usable_outputs_always_runs(build_cache, capsys, cmd, warning):
+    for _ in range(2):
+        assert makepkgbuild.run_shell_step(cmd)
+    assert runs() == 2
+    assert not os.path.isdir(build_cache / "steps")
+    if warning:
+        assert warning in capsys.readouterr().out
+
+def test_parse_shell_cache(workdir):
+    declared = makepkgbuild.parse_shell_cache("make  #CACHE in=a,{PATH_ENV}/b out=/tmp/dist")
+    assert declared == {"in": [str(workdir / "a"), str(workdir / "b")], "out": ["/tmp/dist"]}
+    assert makepkgbuild.parse_shell_cache("echo '#CACHE'") is None
+
+def test_build_cache_prune_evicts_least_recently_used(build_cache):
+    for name, size in (("old", 4000), ("new", 3000)):
+        with open(name, "wb") as f:
+            f.write(os.urandom(size))
+        makepkgbuild.build_cache_store(name, [name])
+    old_manifest = build_cache / "steps" / "old.json"
+    os.utime(old_manifest, (1, 1))
+    makepkgbuild.build_cache_prune(5000)
+    assert not old_manifest.exists()
+    assert (build_cache / "steps" / "new.json").exists()
+    assert len(os.listdir(build_cache / "objects")) == 1
+    assert makepkgbuild.build_cache_stats["evicted"] == 1
+
+
+# Kabuk adımları ve --shell-session
+
+@pytest.fixture
+def session(workdir, monkeypatch):
+    shell = makepkgbuild.ShellSession()
+    monkeypatch.setattr(makepkgbuild, "shell_session", shell)
+    yield shell
+    shell.close()
+
+def shell_output(capsys):
+    return [line[len("[SHELL-OUT] "):] for line in capsys.readouterr().out.splitlines()
+            if line.startswith("[SHELL-OUT] ")]
+
+def test_execute_shell_reports_exit_status_and_tail(workdir, monkeypatch, capsys):
+    monkeypatch.setattr(makepkgbuild, "SHELL_TAIL_LINES", 2)
+    assert not makepkgbuild.execute_shell("for i in 1 2 3; do echo line$i; done; exit 7")
+    out = capsys.readouterr().out
+    assert "exit status 7" in out
+    assert "Last 2 line(s) of output:\nline2\nline3\n" in out
+
+def test_shell_session_keeps_directory_and_variables(session, workdir, capsys):
+    os.mkdir("sub")
+    assert makepkgbuild.execute_shell("cd sub && NAME=kept")
+    assert makepkgbuild.execute_shell('pwd; echo "$NAME"')
+    assert shell_output(capsys) == [str(workdir / "sub"), "kept"]
+
+def test_shell_session_exit_status_and_output_without_newline(session, capsys):
+    assert not makepkgbuild.execute_shell("printf partial; false")
+    out = capsys.readouterr().out
+    assert "[SHELL-OUT] partial\n" in out
+    assert "exit status 1" in out
+    assert session.marker not in out
+    # Başarısız adım oturumu bozmaz
+    assert makepkgbuild.execute_shell("echo next")
+    assert shell_output(capsys) == ["next"]
+
+def test_shell_session_commands_do_not_read_the_script(session, capsys):
+    assert makepkgbuild.execute_shell("cat; echo after")
+    assert makepkgbuild.execute_shell("echo still-running")
+    assert shell_output(capsys) == ["after", "still-running"]
+
+def test_shell_session_exit_fails_the_step_and_later_steps(session, capsys):
+    assert not makepkgbuild.execute_shell("exit 3")
+    assert "shell session exited with status 3" in capsys.readouterr().out
+    assert not makepkgbuild.execute_shell("echo unreachable")
+
+
+# GITCHECK ve paylaşılan git mirror'ları
+
+@pytest.fixture
+def origin(workdir, tmp_path, monkeypatch):
+    for name, value in (("GIT_AUTHOR_NAME", "t"), ("GIT_AUTHOR_EMAIL", "t@t"),
+                        ("GIT_COMMITTER_NAME", "t"), ("GIT_COMMITTER_EMAIL", "t@t")):
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(makepkgbuild, "GIT_CACHE_DIR", str(tmp_path / "git"))
+    repo = tmp_path / "origin"
+    makepkgbuild.git("init", "--quiet", "-b", "main", str(repo))
+
+    def commit(content):
+        (repo / "file.txt").write_text(content)
+        makepkgbuild.git("add", "file.txt", cwd=repo)
+        makepkgbuild.git("commit", "--quiet", "-m", content, cwd=repo)
+        return makepkgbuild.git("rev-parse", "HEAD", cwd=repo)
+    return repo, commit
+
+def checked_out(workdir):
+    return (workdir / "gitrepo" / "file.txt").read_text()
+
+def test_gitcheck_resolves_branch_tag_and_commits(origin, workdir):
+    repo, commit = origin
+    first = commit("first")
+    makepkgbuild.git("tag", "v1", cwd=repo)
+    commit("second")
+    for ref, content in (("main", "second"), ("v1", "first"), (first, "first"), (first[:7], "first")):
+        makepkgbuild.process_gitcheck(f"{repo}@{ref}")
+        assert checked_out(workdir) == content
+    # Yalnızca istenen commit sığ olarak getirilir
+    assert makepkgbuild.git("rev-list", "--count", "HEAD", cwd=workdir / "gitrepo") == "1"
+    assert len(os.listdir(makepkgbuild.GIT_CACHE_DIR)) == 2  # mirror ve kilit dosyası
+
+def test_gitcheck_fetches_new_commits_into_existing_mirror(origin, workdir, capsys):
+    repo, commit = origin
+    commit("first")
+    makepkgbuild.process_gitcheck(f"{repo}@main")
+    second = commit("second")
+    makepkgbuild.process_gitcheck(f"{repo}@{second[:8]}")
+    assert checked_out(workdir) == "second"
+    out = capsys.readouterr().out
+    assert "[GIT] Creating mirror" in out
+    assert "[GIT] Fetching updates into mirror" in out
+
+def test_gitcheck_full_sha_already_in_mirror_skips_fetch(origin, workdir, capsys):
+    repo, commit = origin
+    first = commit("first")
+    makepkgbuild.process_gitcheck(f"{repo}@main")
+    capsys.readouterr()
+    makepkgbuild.process_gitcheck(f"{repo}@{first}")
+    out = capsys.readouterr().out
+    assert f"[GIT] Mirror already has {first}" in out
+    assert "Fetching" not in out
+
+def test_gitcheck_unknown_ref_exits(origin, capsys):
+    repo, commit = origin
+    commit("first")
+    with pytest.raises(SystemExit):
+        makepkgbuild.process_gitcheck(f"{repo}@no-such-ref")
+    assert "[ERR] GITCHECK failed" in capsys.readouterr().out
+
+
+# FTP havuzu ve kaldığı yerden devam
+
+class FTPStandIn:
+    # fetch_ftp'nin kullandığı komutları (PASV, REST, RETR, SIZE) konuşan küçük FTP sunucusu
+    def __init__(self, files, rest=True):
+        self.files = files
+        self.rest = rest
+        self.logins = 0
+        self.retrieved = []
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.session, args=(conn,), daemon=True).start()
+
+    def session(self, conn):
+        f = conn.makefile("rwb", buffering=0)
+        reply = lambda line: f.write(line.encode() + b"\r\n")
+        passive = None
+        offset = 0
+        reply("220 ready")
+        for line in f:
+            cmd, _, arg = line.decode().strip().partition(" ")
+            cmd = cmd.upper()
+            if cmd == "USER":
+                reply("331 password")
+            elif cmd == "PASS":
+                self.logins += 1
+                reply("230 logged in")
+            elif cmd in ("TYPE", "NOOP"):
+                reply("200 ok")
+            elif cmd == "SIZE":
+                if arg in self.files:
+                    reply(f"213 {len(self.files[arg])}")
+                else:
+                    reply("550 no such file")
+            elif cmd == "PASV":
+                passive = socket.create_server(("127.0.0.1", 0))
+                port = passive.getsockname()[1]
+                reply(f"227 Entering Passive Mode (127,0,0,1,{port >> 8},{port & 0xff})")
+            elif cmd == "REST" and self.rest:
+                offset = int(arg)
+                reply(f"350 restarting at {offset}")
+            elif cmd == "RETR":
+                data, _ = passive.accept()
+                reply("150 opening data connection")
+                self.retrieved.append((arg, offset))
+                data.sendall(self.files[arg][offset:])
+                data.close()
+                passive.close()
+                offset = 0
+                reply("226 transfer complete")
+            elif cmd == "QUIT":
+                reply("221 bye")
+                break
+            else:
+                reply("502 not implemented")
+        conn.close()
+
+    def url(self, path):
+        return f"ftp://127.0.0.1:{self.port}{path}"
+
+    def close(self):
+        self.sock.close()
+
+OTHER = os.urandom(1000)
+
+@pytest.fixture
+def ftp_server(workdir, monkeypatch):
+    monkeypatch.setattr(makepkgbuild, "ftp_pool", {})
+    servers = []
+
+    def start(rest=True):
+        server = FTPStandIn({"/pub/payload.bin": PAYLOAD, "/pub/other.bin": OTHER}, rest=rest)
+        servers.append(server)
+        return server
+    yield start
+    makepkgbuild.ftp_close_all()
+    for server in servers:
+        server.close()
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_fetch_ftp_reuses_pooled_session_per_server(ftp_server, workdir):
+    servers = [ftp_server(), ftp_server()]
+    for i, server in enumerate(servers):
+        expect(f"out/{i}/payload.bin", PAYLOAD)
+        makepkgbuild.fetch_ftp(server.url("/pub/payload.bin"), f"out/{i}/payload.bin")
+        makepkgbuild.fetch_ftp(server.url("/pub/other.bin"), f"out/{i}/other.bin")
+        assert read(f"out/{i}/payload.bin") == PAYLOAD
+        assert read(f"out/{i}/other.bin") == OTHER
+    assert [server.logins for server in servers] == [1, 1]
+
+def test_fetch_ftp_resumes_part_file(ftp_server, workdir):
+    server = ftp_server()
+    dest = str(workdir / "payload.bin")
+    half = len(PAYLOAD) // 2
+    with open(dest + ".part", "wb") as f:
+        f.write(PAYLOAD[:half])
+    expect(dest, PAYLOAD)
+    makepkgbuild.fetch_ftp(server.url("/pub/payload.bin"), dest)
+    assert server.retrieved == [("/pub/payload.bin", half)]
+    assert read(dest) == PAYLOAD
+    assert not os.path.exists(dest + ".part")
+
+def test_fetch_ftp_restarts_without_rest_support(ftp_server, workdir):
+    server = ftp_server(rest=False)
+    dest = str(workdir / "payload.bin")
+    with open(dest + ".part", "wb") as f:
+        f.write(b"stale bytes")
+    expect(dest, PAYLOAD)
+    makepkgbuild.fetch_ftp(server.url("/pub/payload.bin"), dest)
+    assert server.retrieved == [("/pub/payload.bin", 0)]
+    assert read(dest) == PAYLOAD
+
+def test_fetch_ftp_checksum_mismatch_is_fatal(ftp_server, workdir):
+    server = ftp_server()
+    dest = str(workdir / "payload.bin")
+    expect(dest, b"something else")
+    with pytest.raises(makepkgbuild.ChecksumError):
+        makepkgbuild.fetch_ftp(server.url("/pub/payload.bin"), dest)
+    assert not os.path.exists(dest)
+    assert not os.path.exists(dest + ".part")
+
+
+# --plan
+
+def plan(commands, upstreams, **kwargs):
+    return makepkgbuild.build_plan({}, commands, upstreams, workers=1, bandwidth=1000, **kwargs)
+
+def test_plan_complete_part_file_costs_no_bandwidth(workdir, upstream):
+    server = upstream()
+    os.makedirs("out")
+    with open("out/payload.bin.part", "wb") as f:
+        f.write(PAYLOAD)
+    result = plan(["setup -Dm644 data_env1:src:out/payload.bin"], [server.url + "/payload.bin"])
+    step = result["steps"][0]
+    assert (step["size"], step["bytes_to_transfer"]) == (len(PAYLOAD), 0)
+    assert result["unknown_transfer_sizes"] == 0
+    assert result["estimated_wall_seconds"] < 5
+
+def test_plan_partial_download_costs_the_remainder(workdir, upstream):
+    server = upstream()
+    os.makedirs("out")
+    with open("out/payload.bin.part", "wb") as f:
+        f.write(PAYLOAD[:-5000])
+    result = plan(["setup -Dm644 data_env1:src:out/payload.bin"], [server.url + "/payload.bin"])
+    assert result["bytes_to_transfer"] == 5000
+    assert 5 <= result["estimated_wall_seconds"] < 10
+
+def test_plan_local_copies_cost_no_bandwidth(workdir):
+    source = workdir.parent / "big.bin"
+    source.write_bytes(PAYLOAD)
+    result = plan(["setup -Dm644 data_env1:src:out/big.bin"], [f"data://file{source}"])
+    step = result["steps"][0]
+    assert (step["via"], step["size"], step["bytes_to_transfer"]) == ("local", len(PAYLOAD), 0)
+    assert result["mirrors"] == []
+    assert result["estimated_wall_seconds"] < 5
+
+def test_plan_counts_unknown_sizes(workdir, upstream):
+    server = upstream()
+    result = plan(["setup -Dm644 data_env1:src:out/missing.bin"], [server.url + "/missing.bin"])
+    step = result["steps"][0]
+    assert step["bytes_to_transfer"] is None
+    assert "error" in step
+    assert result["unknown_transfer_sizes"] == 1
+
+def test_plan_reports_cached_steps_as_satisfied(build_cache, upstream):
+    server = upstream()
+    expect("out/payload.bin", PAYLOAD)
+    upstreams = [server.url + "/payload.bin"]
+    with open("in.txt", "w") as f:
+        f.write("one")
+    commands = ["setup -Dm644 data_env1:src:out/payload.bin", SHELL_STEP, "echo uncached"]
+    makepkgbuild.run_build(commands, upstreams)
+    result = plan(commands, upstreams)
+    assert result["satisfied_steps"] == [1, 2]
+    assert result["bytes_to_transfer"] == 0
+    assert result["steps"][2]["reason"] == "shell steps without #CACHE outputs always run"
+    result = plan(commands, upstreams, session=True)
+    assert result["satisfied_steps"] == [1]